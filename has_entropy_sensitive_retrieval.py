@@ -1,9 +1,1299 @@
 import re
+import asyncio
+import atexit
+import hashlib
+import itertools
 import math
+import os
 import random
 import re
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
 import time
-from collections import Counter, defaultdict
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict, defaultdict, deque, namedtuple
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖：未安装时熵计算使用纯Python实现
+    np = None
+
+# 候选片段评分结果：片段文本、字符区间、综合熵值和敏感类型（非敏感时为None）
+CandidateScore = namedtuple('CandidateScore', ['text', 'start', 'end', 'entropy', 'type'])
+
+# 按所需敏感类型规划的检测方案：types 为 None 表示检测全部类型
+# structured_rules: 需要运行的熵检测阶段结构化规则；entropy: 是否枚举熵检测候选；
+# identity/tail: 是否执行公司与姓名判断、按熵值区间的后续判断；accepts: 候选阶段保留的类型；key: 缓存键中区分方案的字节串
+# 启用的正则类型始终在同一次合并扫描中运行：代价很低，其结果用于屏蔽后续阶段（如身份证号中形似手机号的片段）
+DetectionPlan = namedtuple('DetectionPlan', ['types', 'structured_rules', 'entropy', 'identity', 'tail', 'accepts', 'key'])
+
+class IncrementalEntropy:
+    """增量式熵计算器：逐token扩展候选片段时维护字符/二元/三元组计数和熵累加量"""
+    __slots__ = ('length', 'tail', 'counts', 'sums')
+
+    def __init__(self):
+        # 当前片段的字符数
+        self.length = 0
+        # 最近的两个字符，用于生成跨token边界的二元/三元组
+        self.tail = ''
+        # 依次为字符、二元组、三元组的计数表
+        self.counts = ({}, {}, {})
+        # 对应计数表的 Σ c·log2(c)，熵 H = log2(N) - Σ c·log2(c) / N
+        self.sums = [0.0, 0.0, 0.0]
+
+    def _add(self, level, key):
+        """将一个单元计数加一，并增量更新 Σ c·log2(c)"""
+        counts = self.counts[level]
+        count = counts.get(key, 0)
+        if count:
+            self.sums[level] += (count + 1) * math.log2(count + 1) - count * math.log2(count)
+        counts[key] = count + 1
+
+    def push(self, token):
+        """在片段末尾追加一个token，只处理新增的字符及其形成的n-gram"""
+        tail = self.tail
+        for char in token:
+            self._add(0, char)
+            if tail:
+                self._add(1, tail[-1] + char)
+                if len(tail) == 2:
+                    self._add(2, tail + char)
+            tail = (tail + char)[-2:]
+        self.tail = tail
+        self.length += len(token)
+
+    def _entropy(self, level):
+        """根据计数总量和累加量计算指定粒度的熵"""
+        total = self.length - level
+        if total <= 1:
+            return 0.0
+        return max(0.0, math.log2(total) - self.sums[level] / total)
+
+    def entropies(self):
+        """返回当前片段的 (字符熵, 二元组熵, 三元组熵)"""
+        return self._entropy(0), self._entropy(1), self._entropy(2)
+
+class BatchEntropy:
+    """基于NumPy的批量熵计算器：文档只编码一次为码点数组，所有候选区间的字符/二元组/三元组熵在向量化运算中一并求出
+    同一起点的候选区间共享一行前缀累加量，结果与 IncrementalEntropy 逐位一致
+    """
+    # 每批窗口矩阵（行数 × 窗口长度）的元素上限，控制单批内存占用
+    BATCH_CELLS = 1 << 20
+
+    def __init__(self, text):
+        # UTF-32编码后每个字符恰好对应一个码点
+        codepoints = np.frombuffer(text.encode('utf-32-le'), dtype='<u4').astype(np.int64)
+        # 码点不超过21位，二元/三元组按位拼接成唯一的整数编码
+        self.codes = (
+            codepoints,
+            (codepoints[:-1] << 21) | codepoints[1:],
+            (codepoints[:-2] << 42) | (codepoints[1:-1] << 21) | codepoints[2:],
+        )
+
+    @staticmethod
+    def _tables(size):
+        """计数由 c-1 增至 c 时 Σ c·log2(c) 的增量表及 log2 表，与 IncrementalEntropy 使用相同的标量运算"""
+        increments = [0.0, 0.0] + [count * math.log2(count) - (count - 1) * math.log2(count - 1)
+                                   for count in range(2, size + 1)]
+        logs = [0.0] + [math.log2(n) for n in range(1, size + 1)]
+        return np.array(increments), np.array(logs)
+
+    @staticmethod
+    def _occurrence_ranks(window):
+        """逐行计算每个单元截至当前位置的出现次数，即该单元计数更新后的值
+        行内稳定排序后，相同单元连续排列且保持原有先后顺序，出现次数为其在同值段中的序号
+        """
+        width = window.shape[1]
+        order = np.argsort(window, axis=1, kind='stable')
+        ordered = np.take_along_axis(window, order, axis=1)
+        positions = np.broadcast_to(np.arange(width), window.shape)
+        run_start = np.ones(window.shape, dtype=bool)
+        run_start[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+        run_first = np.maximum.accumulate(np.where(run_start, positions, 0), axis=1)
+        ranks = np.empty(window.shape, dtype=np.int64)
+        np.put_along_axis(ranks, order, positions - run_first + 1, axis=1)
+        return ranks
+
+    def entropies(self, starts, ends):
+        """返回形状为 (3, 区间数) 的数组，依次为各区间 [start, end) 的字符熵、二元组熵和三元组熵"""
+        starts = np.asarray(starts, dtype=np.int64)
+        lengths = np.asarray(ends, dtype=np.int64) - starts
+        result = np.zeros((3, len(starts)))
+        if not len(starts):
+            return result
+        increments, logs = self._tables(int(lengths.max()))
+        
+        # 按起点分行：每行只需覆盖该起点最长的区间；各行按窗口长度排序，使同批的行长度相近
+        row_starts, rows = np.unique(starts, return_inverse=True)
+        row_lengths = np.zeros(len(row_starts), dtype=np.int64)
+        np.maximum.at(row_lengths, rows, lengths)
+        row_order = np.argsort(row_lengths, kind='stable')
+        row_rank = np.empty_like(row_order)
+        row_rank[row_order] = np.arange(len(row_order))
+        span_rows = row_rank[rows]
+        order = np.argsort(span_rows, kind='stable')
+        sorted_rows = span_rows[order]
+        
+        for level, codes in enumerate(self.codes):
+            if not len(codes):
+                continue
+            widths = np.maximum(1, row_lengths[row_order] - level)
+            first = 0
+            while first < len(row_order):
+                # 窗口长度递增，取满足 行数 × 最大窗口长度 不超过上限的最多行
+                candidates = widths[first:first + max(1, self.BATCH_CELLS // int(widths[first]))]
+                fits = np.arange(1, len(candidates) + 1) * candidates <= self.BATCH_CELLS
+                last = first + max(1, int(fits.sum()))
+                width = int(widths[last - 1])
+                
+                index = np.minimum(row_starts[row_order[first:last], None] + np.arange(width), len(codes) - 1)
+                ranks = self._occurrence_ranks(codes[index])
+                sums = np.cumsum(increments[ranks], axis=1)
+                
+                # 落在本批行中的区间：总量 = 区间长度 - level，总量不超过1时熵为0
+                lo, hi = np.searchsorted(sorted_rows, (first, last))
+                spans = order[lo:hi]
+                totals = lengths[spans] - level
+                valid = totals > 1
+                spans, totals = spans[valid], totals[valid]
+                values = logs[totals] - sums[span_rows[spans] - first, totals - 1] / totals
+                result[level, spans] = np.maximum(0.0, values)
+                first = last
+        return result
+
+class PatternRegistry:
+    """正则表达式注册表：每个模式只编译一次，并统计各模式的调用次数、命中次数和耗时"""
+    
+    def __init__(self):
+        # 名称 -> (模式源码, 编译后的正则对象)
+        self.patterns = {}
+        # 名称 -> {'calls': 调用次数, 'hits': 命中次数, 'time': 累计耗时（秒）}
+        self.stats = {}
+    
+    def register(self, name, source):
+        """注册模式，源码未变化时复用已编译的对象；返回是否发生了（重新）编译"""
+        entry = self.patterns.get(name)
+        if entry is not None and entry[0] == source:
+            return False
+        self.patterns[name] = (source, re.compile(source))
+        self.stats[name] = {'calls': 0, 'hits': 0, 'time': 0.0}
+        return True
+    
+    def unregister(self, name):
+        """移除模式及其统计信息"""
+        self.patterns.pop(name, None)
+        self.stats.pop(name, None)
+    
+    def __contains__(self, name):
+        return name in self.patterns
+    
+    def compiled(self, name):
+        """获取编译后的正则对象"""
+        return self.patterns[name][1]
+    
+    def compiled_source(self, source):
+        """按源码查找已注册的编译对象，未注册时直接编译"""
+        for registered_source, pattern in self.patterns.values():
+            if registered_source == source:
+                return pattern
+        return re.compile(source)
+    
+    def _record(self, name, hits, start_time):
+        stats = self.stats[name]
+        stats['calls'] += 1
+        stats['hits'] += hits
+        stats['time'] += time.perf_counter() - start_time
+    
+    def record_hits(self, name, hits):
+        """记录通过合并扫描间接产生的命中次数"""
+        self.stats[name]['hits'] += hits
+    
+    def finditer(self, name, text):
+        """返回模式在文本中的全部匹配对象列表"""
+        start_time = time.perf_counter()
+        matches = list(self.patterns[name][1].finditer(text))
+        self._record(name, len(matches), start_time)
+        return matches
+    
+    def search(self, name, text):
+        """在文本中查找模式的第一个匹配"""
+        start_time = time.perf_counter()
+        match = self.patterns[name][1].search(text)
+        self._record(name, 1 if match else 0, start_time)
+        return match
+    
+    def get_stats(self):
+        """返回各模式的统计信息副本"""
+        return {name: {'pattern': self.patterns[name][0], **stats} for name, stats in self.stats.items()}
+
+class DetectionCache:
+    """检测结果的LRU缓存：键为文本哈希加配置指纹，按条目数和估算字节数双重限制"""
+    
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # 键 -> (检测结果, 估算字节数)，最久未使用的在前
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def key(text, fingerprint):
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16, key=fingerprint).digest()
+    
+    @staticmethod
+    def _copy(matches):
+        # 调用方可能修改检测结果，存取时都复制
+        return [dict(match) for match in matches]
+    
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return self._copy(entry[0])
+    
+    def put(self, key, matches):
+        size = sys.getsizeof(matches) + sum(sys.getsizeof(match) + sys.getsizeof(match['text']) for match in matches)
+        if size > self.max_bytes:
+            return
+        matches = self._copy(matches)
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self.entries[key] = (matches, size)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.bytes -= evicted_size
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+    
+    def get_stats(self):
+        """返回命中次数、未命中次数、命中率、条目数和估算字节数"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self.entries),
+                'bytes': self.bytes
+            }
+
+class CascadeStats:
+    """级联检测的分阶段覆盖统计：累计检测的文档数和字符数、正则阶段覆盖的字符数、
+    熵检测阶段实际扫描的未覆盖字符数以及熵检测结果覆盖的字符数
+    """
+    STAGES = ('characters', 'regex_covered', 'entropy_scanned', 'entropy_covered')
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.documents = 0
+        self.counts = dict.fromkeys(self.STAGES, 0)
+    
+    def record(self, **counts):
+        """累加一次检测各阶段的字符数"""
+        with self.lock:
+            self.documents += 1
+            for name, value in counts.items():
+                self.counts[name] += value
+    
+    def get_stats(self):
+        """返回各阶段累计字符数及其占检测总字符数的比例"""
+        with self.lock:
+            total = self.counts['characters']
+            stats = {'documents': self.documents, **self.counts}
+            for name in self.STAGES[1:]:
+                stats[name + '_ratio'] = self.counts[name] / total if total else 0.0
+            return stats
+
+class KeywordAutomaton:
+    """Aho-Corasick 多关键词自动机：一次扫描文本即可得到所有分类关键词的出现位置"""
+    
+    def __init__(self, keyword_groups):
+        """keyword_groups: 分类名 -> 关键词列表，同一关键词可以属于多个分类"""
+        # 状态转移表、失配指针和每个状态输出的 (关键词长度, 分类)
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        self.categories = tuple(keyword_groups)
+        
+        for category, keywords in keyword_groups.items():
+            for keyword in keywords:
+                if keyword:
+                    self._insert(keyword, category)
+        self._build_fail_links()
+    
+    def _insert(self, keyword, category):
+        """将关键词插入字典树"""
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append((len(keyword), category))
+    
+    def _build_fail_links(self):
+        """广度优先构建失配指针，并合并失配链上的输出"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+    
+    def index(self, text):
+        """扫描文本，返回可按区间查询关键词的 KeywordIndex"""
+        hits = {category: ([], []) for category in self.categories}
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for pos, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, category in output[state]:
+                ends, starts = hits[category]
+                ends.append(pos + 1)
+                starts.append(pos + 1 - length)
+        return KeywordIndex(hits)
+
+class KeywordIndex:
+    """单个文档的关键词命中索引，回答“区间 [start, end) 内是否出现某类关键词”"""
+    __slots__ = ('ends', 'max_starts')
+    
+    def __init__(self, hits):
+        # 每个分类的命中按结束位置有序排列，max_starts[k] 为前k+1个命中中最大的起始位置
+        self.ends = {}
+        self.max_starts = {}
+        for category, (ends, starts) in hits.items():
+            max_starts = array('i')
+            current = -1
+            for start in starts:
+                current = max(current, start)
+                max_starts.append(current)
+            self.ends[category] = array('i', ends)
+            self.max_starts[category] = max_starts
+    
+    def contains(self, category, start, end):
+        """判断区间 [start, end) 内是否完整包含该分类的某个关键词"""
+        idx = bisect_right(self.ends[category], end) - 1
+        return idx >= 0 and self.max_starts[category][idx] >= start
+
+class CharClassIndex:
+    """文档级字符类别索引：一次遍历构建各字符类别的前缀计数数组和句末标点标记，
+    任意区间 [start, end) 是否含数字、字母、标点占比等判断都只需两次数组查找
+    offset: 被索引文本在文档中的起始位置，查询时使用文档坐标
+    """
+    __slots__ = ('offset', 'length', 'counts', 'terminals')
+    
+    PUNCTUATION = frozenset('，。！？；：""''（）【】《》')
+    SENTENCE_TERMINALS = frozenset('。！？')
+    # 类别名与启发式模式同名，可直接替代对应的 re.search
+    CLASSES = ('heuristic.digits', 'heuristic.latin', 'heuristic.ascii_digits', 'heuristic.word',
+               'heuristic.alnum_run', 'cjk', 'punctuation', 'dash')
+    # 连续字母数字串的最小长度，与 heuristic.alnum_run 一致
+    ALNUM_RUN = 6
+    
+    def __init__(self, text, offset=0):
+        self.offset = offset
+        self.length = len(text)
+        punctuation = self.PUNCTUATION
+        terminals = self.SENTENCE_TERMINALS
+        counts = {name: array('i', [0]) for name in self.CLASSES}
+        digits, latin, ascii_digits, word, alnum_run, cjk, punct, dash = (counts[name] for name in self.CLASSES)
+        self.terminals = bytearray(self.length)
+        
+        n_digits = n_latin = n_ascii_digits = n_word = n_alnum_run = n_cjk = n_punct = n_dash = 0
+        run = 0
+        for i, char in enumerate(text):
+            if '0' <= char <= '9':
+                n_ascii_digits += 1
+                n_digits += 1
+                run += 1
+            elif 'a' <= char <= 'z' or 'A' <= char <= 'Z':
+                n_latin += 1
+                n_word += 1
+                run += 1
+            else:
+                run = 0
+                if '\u4e00' <= char <= '\u9fff':
+                    n_cjk += 1
+                    if char <= '\u9fa5':
+                        n_word += 1
+                elif char.isdecimal():
+                    n_digits += 1
+                elif char in punctuation:
+                    n_punct += 1
+                    if char in terminals:
+                        self.terminals[i] = 1
+                elif char == '-' or char == '_':
+                    n_dash += 1
+            # 以当前字符结尾的连续字母数字串达到最小长度
+            if run >= self.ALNUM_RUN:
+                n_alnum_run += 1
+            digits.append(n_digits)
+            latin.append(n_latin)
+            ascii_digits.append(n_ascii_digits)
+            word.append(n_word)
+            alnum_run.append(n_alnum_run)
+            cjk.append(n_cjk)
+            punct.append(n_punct)
+            dash.append(n_dash)
+        self.counts = counts
+    
+    def count(self, name, start, end):
+        """区间 [start, end) 内属于指定类别的字符数"""
+        prefix = self.counts[name]
+        return prefix[end - self.offset] - prefix[start - self.offset]
+    
+    def contains(self, name, start, end):
+        """区间内是否含指定类别的字符；heuristic.alnum_run 表示是否含足够长的连续字母数字串"""
+        if name == 'heuristic.alnum_run':
+            # 串的结尾位置需在区间内且距区间起点至少 ALNUM_RUN-1 个字符，整个串才落在区间内
+            start = start + self.ALNUM_RUN - 1
+            if start >= end:
+                return False
+        return self.count(name, start, end) > 0
+    
+    def all_cjk(self, start, end):
+        return self.count('cjk', start, end) == end - start
+    
+    def after_terminal(self, start):
+        """start 是否位于文档开头或句末标点之后"""
+        local = start - self.offset
+        return start == 0 or (local > 0 and self.terminals[local - 1] == 1)
+    
+    def before_terminal(self, end, document_length):
+        """end 是否位于文档结尾或句末标点之前"""
+        local = end - self.offset
+        return end == document_length or (local < self.length and self.terminals[local] == 1)
+
+class CodepointTokenizer:
+    """基于NumPy的向量化分词器：按码点类别（汉字/字母数字/标点/其他）划分字符串，
+    与默认 tokenizer 正则的切分结果一致——汉字、ASCII字母数字和中文标点各自连续成段，
+    其余非空白字符单独成段，空白字符不产生token
+    """
+    CJK, ALNUM, PUNCTUATION, OTHER, SPACE = 1, 2, 3, 4, 0
+    # 空白字符和中文标点都在基本多文种平面内，类别表只需覆盖到此处，更大的码点都归为其他字符
+    TABLE_SIZE = 0x10000
+    _table = None
+    
+    @classmethod
+    def table(cls):
+        """码点 -> 类别的查找表，首次使用时构建"""
+        if cls._table is None:
+            table = np.full(cls.TABLE_SIZE, cls.OTHER, dtype=np.uint8)
+            table[[code for code in range(cls.TABLE_SIZE) if chr(code).isspace()]] = cls.SPACE
+            table[[ord(char) for char in '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ']] = cls.ALNUM
+            table[[ord(char) for char in CharClassIndex.PUNCTUATION]] = cls.PUNCTUATION
+            cls._table = table
+        return cls._table
+    
+    @classmethod
+    def tokenize(cls, text):
+        """返回每个token的 (起始位置数组, 结束位置数组)，均为 int32"""
+        codepoints = np.frombuffer(text.encode('utf-32-le'), dtype='<u4')
+        table = cls.table()
+        classes = np.where(codepoints < cls.TABLE_SIZE, table[np.minimum(codepoints, cls.TABLE_SIZE - 1)], cls.OTHER)
+        classes[(codepoints >= 0x4e00) & (codepoints <= 0x9fa5)] = cls.CJK
+        
+        # 类别变化处是段边界；其他字符每个单独成段
+        boundary = np.ones(len(classes), dtype=bool)
+        boundary[1:] = classes[1:] != classes[:-1]
+        boundary |= classes == cls.OTHER
+        bounds = np.flatnonzero(boundary).astype(np.int32)
+        ends = np.append(bounds[1:], np.int32(len(classes)))
+        keep = classes[bounds] != cls.SPACE
+        return bounds[keep], ends[keep]
+
+class IntervalSet:
+    """按起始位置有序存放的不相交半开区间集合，用于候选片段的重叠判断
+    空间和时间只与区间数量相关，与文档长度无关
+    """
+    __slots__ = ('starts', 'ends')
+    
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+    
+    def __len__(self):
+        return len(self.starts)
+    
+    def overlaps(self, start, end):
+        """判断 [start, end) 是否与集合中任一区间重叠"""
+        if start >= end:
+            return False
+        # 区间互不相交，起始位置小于 end 的最后一个区间的结束位置最大
+        idx = bisect_left(self.starts, end) - 1
+        return idx >= 0 and self.ends[idx] > start
+    
+    def add(self, start, end):
+        """加入区间 [start, end)，与已有区间重叠时合并"""
+        if start >= end:
+            return
+        lo = bisect_right(self.ends, start)
+        hi = bisect_left(self.starts, end)
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+    
+    def covered(self, start=None, end=None):
+        """集合覆盖的总长度；指定 [start, end) 时只计算该范围内的部分"""
+        if start is None and end is None:
+            return sum(self.ends) - sum(self.starts)
+        return sum(min(hi, end) - max(lo, start) for lo, hi in zip(self.starts, self.ends) if lo < end and hi > start)
+    
+    def gaps(self, start, end):
+        """依次返回 [start, end) 中不被集合覆盖的各个区间"""
+        for lo, hi in zip(self.starts, self.ends):
+            if hi <= start:
+                continue
+            if lo >= end:
+                break
+            if lo > start:
+                yield start, lo
+            start = max(start, hi)
+        if start < end:
+            yield start, end
+
+class RestoreEngine:
+    """还原引擎：将映射关系编译为一个前缀树结构的正则，一次扫描完成全部还原替换"""
+    __slots__ = ('lookup', 'pattern', 'size', 'prefixes', 'max_prefix')
+    
+    def __init__(self, mapping):
+        # 待查找文本 -> 原始文本；占位符映射查找占位符，假名化/泛化映射查找替代文本
+        lookup = {}
+        # 与逐个替换时的顺序一致：占位符越长越优先，重复的查找文本以先出现者为准
+        for placeholder, original_text in sorted(mapping.items(), key=lambda x: len(x[0]), reverse=True):
+            if isinstance(original_text, tuple):
+                key, value = original_text
+            else:
+                key, value = placeholder, original_text
+            if key:
+                lookup.setdefault(key, value)
+        
+        self.lookup = lookup
+        self.size = len(mapping)
+        self.pattern = re.compile(self._trie_regex(lookup)) if lookup else None
+        # 流式还原用到的查找文本真前缀集合，首次流式还原时才构建
+        self.prefixes = None
+        self.max_prefix = 0
+    
+    @staticmethod
+    def _trie_regex(words):
+        """将词表构建为前缀树形式的正则，同一位置优先匹配最长的词"""
+        trie = {}
+        for word in words:
+            node = trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[''] = None
+        
+        def emit(node):
+            parts = []
+            # 单一路径直接展开，只在分叉处递归
+            while len(node) == 1 and '' not in node:
+                char, node = next(iter(node.items()))
+                parts.append(re.escape(char))
+            if node.keys() == {''}:
+                return ''.join(parts)
+            
+            branches = [re.escape(char) + emit(child) for char, child in node.items() if char]
+            group = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+            if '' in node:
+                # 贪婪的可选分组：能匹配更长的词时优先匹配更长的
+                group = '(?:' + group + ')?'
+            return ''.join(parts) + group
+        
+        return emit(trie)
+    
+    def restore(self, text):
+        """一次扫描完成所有替换"""
+        if self.pattern is None:
+            return text
+        lookup = self.lookup
+        return self.pattern.sub(lambda match: lookup[match.group()], text)
+    
+    def _build_prefixes(self):
+        """收集所有查找文本的真前缀，用于判断缓冲区末尾是否可能是未完整到达的占位符"""
+        prefixes = set()
+        for key in self.lookup:
+            for i in range(1, len(key)):
+                prefixes.add(key[:i])
+        self.prefixes = prefixes
+        self.max_prefix = max(map(len, prefixes), default=0)
+    
+    def restore_stream(self, chunks):
+        """流式还原：每到达一个文本块就输出可确定的还原结果，只保留可能是占位符开头的最短后缀"""
+        if self.pattern is None:
+            for chunk in chunks:
+                if chunk:
+                    yield chunk
+            return
+        if self.prefixes is None:
+            self._build_prefixes()
+        
+        lookup = self.lookup
+        prefixes = self.prefixes
+        pending = ''
+        for chunk in chunks:
+            if not chunk:
+                continue
+            buffer = pending + chunk
+            length = len(buffer)
+            
+            # 最早的、可能随后续文本补全为查找文本的后缀起点
+            cut = length
+            for i in range(max(0, length - self.max_prefix), length):
+                if buffer[i:] in prefixes:
+                    cut = i
+                    break
+            
+            # 只替换完整落在截断点之前的匹配；跨越截断点的匹配连同其后的文本留待下一块
+            segments = []
+            cursor = 0
+            for match in self.pattern.finditer(buffer):
+                if match.end() > cut:
+                    if match.start() < cut:
+                        cut = match.start()
+                    break
+                segments.append(buffer[cursor:match.start()])
+                segments.append(lookup[match.group()])
+                cursor = match.end()
+            segments.append(buffer[cursor:cut])
+            
+            pending = buffer[cut:]
+            output = ''.join(segments)
+            if output:
+                yield output
+        
+        if pending:
+            yield self.restore(pending)
+
+class CompactMapping(Mapping):
+    """紧凑的只读映射关系：占位符拆分为驻留的模板（编号前后的文本）和整数编号，
+    原始文本和替代文本依次拼接在一个UTF-8缓冲区中，以偏移数组定位。
+    实现 Mapping 接口，可直接用于还原；to_bytes/from_bytes 提供持久化和进程间传输的二进制格式
+    """
+    __slots__ = ('templates', 'template_index', 'template_ids', 'numbers', 'kinds', 'offsets', 'buffer',
+                 'sorted_keys', 'positions')
+    
+    MAGIC = b'HASM'
+    VERSION = 1
+    HEADER = struct.Struct('<4sBIII')
+    TEMPLATE_HEADER = struct.Struct('<HH')
+    # 占位符中最后一段数字视为编号
+    NUMBER_PATTERN = re.compile(r'\d+(?=\D*$)')
+    
+    def __init__(self, mapping=None):
+        self.templates = []
+        self.template_index = {}
+        self.template_ids = array('I')
+        self.numbers = array('i')
+        # 0: 占位符 -> 原始文本；1: 占位符 -> (替代文本, 原始文本)
+        self.kinds = array('B')
+        # 第 i 个条目的替代文本和原始文本分别位于第 2i 和 2i+1 段
+        self.offsets = array('I', [0])
+        
+        parts = []
+        size = 0
+        for placeholder, original_text in (mapping or {}).items():
+            template, number = self._split(placeholder)
+            template_id = self.template_index.get(template)
+            if template_id is None:
+                template_id = self.template_index[template] = len(self.templates)
+                self.templates.append(template)
+            self.template_ids.append(template_id)
+            self.numbers.append(number)
+            
+            if isinstance(original_text, tuple):
+                self.kinds.append(1)
+                texts = original_text
+            else:
+                self.kinds.append(0)
+                texts = ('', original_text)
+            for text in texts:
+                data = text.encode('utf-8')
+                parts.append(data)
+                size += len(data)
+                self.offsets.append(size)
+        
+        self.buffer = b''.join(parts)
+        self._build_index()
+    
+    @classmethod
+    def _split(cls, placeholder):
+        """将占位符拆分为 ((前缀, 后缀), 编号)；没有可用编号时编号为-1"""
+        match = cls.NUMBER_PATTERN.search(placeholder)
+        if match:
+            digits = match.group()
+            # 带前导零或过长的数字无法由整数还原，整体作为模板
+            if len(digits) <= 9 and (digits == '0' or digits[0] != '0'):
+                return (placeholder[:match.start()], placeholder[match.end():]), int(digits)
+        return (placeholder, ''), -1
+    
+    @staticmethod
+    def _key(template_id, number):
+        return (template_id << 32) | (number + 1)
+    
+    def _build_index(self):
+        """按 (模板, 编号) 排序的查找索引，查找时二分"""
+        keys = sorted((self._key(template_id, number), i)
+                      for i, (template_id, number) in enumerate(zip(self.template_ids, self.numbers)))
+        self.sorted_keys = array('q', [key for key, _ in keys])
+        self.positions = array('I', [i for _, i in keys])
+    
+    def _text(self, index):
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]].decode('utf-8')
+    
+    def _placeholder(self, i):
+        prefix, suffix = self.templates[self.template_ids[i]]
+        number = self.numbers[i]
+        return prefix + suffix if number < 0 else f'{prefix}{number}{suffix}'
+    
+    def _value(self, i):
+        original_text = self._text(2 * i + 1)
+        return (self._text(2 * i), original_text) if self.kinds[i] else original_text
+    
+    def __getitem__(self, placeholder):
+        template, number = self._split(placeholder)
+        template_id = self.template_index.get(template)
+        if template_id is not None:
+            key = self._key(template_id, number)
+            index = bisect_left(self.sorted_keys, key)
+            if index < len(self.sorted_keys) and self.sorted_keys[index] == key:
+                return self._value(self.positions[index])
+        raise KeyError(placeholder)
+    
+    def __iter__(self):
+        return (self._placeholder(i) for i in range(len(self.kinds)))
+    
+    def __len__(self):
+        return len(self.kinds)
+    
+    def items(self):
+        """按插入顺序返回 (占位符, 原始文本) 列表，逐条顺序解码，无需查找"""
+        return [(self._placeholder(i), self._value(i)) for i in range(len(self.kinds))]
+    
+    def __sizeof__(self):
+        arrays = (self.template_ids, self.numbers, self.kinds, self.offsets, self.sorted_keys, self.positions)
+        return (object.__sizeof__(self) + sys.getsizeof(self.buffer)
+                + sum(array_.buffer_info()[1] * array_.itemsize for array_ in arrays)
+                + sum(sys.getsizeof(prefix) + sys.getsizeof(suffix) for prefix, suffix in self.templates))
+    
+    def __repr__(self):
+        return f'{type(self).__name__}({dict(self.items())!r})'
+    
+    def __reduce__(self):
+        return type(self).from_bytes, (self.to_bytes(),)
+    
+    @staticmethod
+    def _little_endian(values):
+        if sys.byteorder == 'big':
+            values = array(values.typecode, values)
+            values.byteswap()
+        return values.tobytes()
+    
+    def to_bytes(self):
+        """序列化为二进制：头部、模板表、编号与偏移数组、文本缓冲区"""
+        parts = [self.HEADER.pack(self.MAGIC, self.VERSION, len(self.templates), len(self), len(self.buffer))]
+        for prefix, suffix in self.templates:
+            prefix, suffix = prefix.encode('utf-8'), suffix.encode('utf-8')
+            parts.append(self.TEMPLATE_HEADER.pack(len(prefix), len(suffix)))
+            parts.append(prefix + suffix)
+        for values in (self.template_ids, self.numbers, self.kinds, self.offsets):
+            parts.append(self._little_endian(values))
+        parts.append(self.buffer)
+        return b''.join(parts)
+    
+    @classmethod
+    def from_bytes(cls, data):
+        """从 to_bytes 的结果重建映射"""
+        magic, version, num_templates, num_entries, buffer_size = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError("不支持的映射数据格式")
+        
+        mapping = cls.__new__(cls)
+        position = cls.HEADER.size
+        mapping.templates = []
+        for _ in range(num_templates):
+            prefix_size, suffix_size = cls.TEMPLATE_HEADER.unpack_from(data, position)
+            position += cls.TEMPLATE_HEADER.size
+            prefix = bytes(data[position:position + prefix_size]).decode('utf-8')
+            position += prefix_size
+            suffix = bytes(data[position:position + suffix_size]).decode('utf-8')
+            position += suffix_size
+            mapping.templates.append((prefix, suffix))
+        mapping.template_index = {template: i for i, template in enumerate(mapping.templates)}
+        
+        for name, typecode, count in (('template_ids', 'I', num_entries), ('numbers', 'i', num_entries),
+                                      ('kinds', 'B', num_entries), ('offsets', 'I', 2 * num_entries + 1)):
+            values = array(typecode)
+            end = position + count * values.itemsize
+            values.frombytes(data[position:end])
+            if sys.byteorder == 'big':
+                values.byteswap()
+            setattr(mapping, name, values)
+            position = end
+        
+        mapping.buffer = bytes(data[position:position + buffer_size])
+        mapping._build_index()
+        return mapping
+
+class SessionStripe:
+    """会话存储的一个分条：独立的锁保护的映射关系和还原引擎缓存"""
+    __slots__ = ('lock', 'mappings', 'engines')
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        # 会话ID -> 映射关系
+        self.mappings = {}
+        # 会话ID -> 已编译的还原引擎
+        self.engines = {}
+
+class SessionStore:
+    """线程安全的会话存储：映射关系分散到多个分条，每个分条各自加锁，不同分条上的读写互不阻塞
+    会话数、内存占用和最近访问顺序在全局统一记录，由一把只做O(1)簿记的小锁保护；
+    超出会话数或内存上限时按全局LRU淘汰最久未访问的会话，设置了过期时间时淘汰超时未访问的会话（TTL）
+    加锁顺序：持有簿记锁时不再获取分条锁
+    """
+    
+    def __init__(self, max_sessions=1000, stripes=16, ttl=None, max_bytes=None):
+        self.stripes = [SessionStripe() for _ in range(stripes)]
+        # 全局簿记：会话ID -> [最近访问时间, 估算占用字节数]，最久未访问的在前
+        self.lock = threading.Lock()
+        self.order = OrderedDict()
+        self.bytes = 0
+        self.configure(max_sessions=max_sessions, ttl=ttl, max_bytes=max_bytes)
+        # itertools.count 的 next() 在解释器内部一次完成，多线程下不会产生重复序号
+        self.ids = itertools.count(1)
+    
+    def configure(self, max_sessions=1000, ttl=None, max_bytes=None):
+        """设置容量限制：会话总数上限、过期时间（秒）和映射占用的内存上限（字节），None表示不限"""
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._evict(time.monotonic())
+    
+    @staticmethod
+    def mapping_size(mapping):
+        """估算映射关系占用的内存字节数"""
+        if isinstance(mapping, CompactMapping):
+            return sys.getsizeof(mapping)
+        size = sys.getsizeof(mapping)
+        for placeholder, original_text in mapping.items():
+            size += sys.getsizeof(placeholder)
+            if isinstance(original_text, tuple):
+                size += sys.getsizeof(original_text) + sum(sys.getsizeof(text) for text in original_text)
+            else:
+                size += sys.getsizeof(original_text)
+        return size
+    
+    def _stripe(self, session_id):
+        """按会话ID中的序号轮流分配分条；非本存储生成的ID按哈希分配"""
+        _, _, serial = session_id.rpartition('_')
+        index = int(serial) if serial.isdigit() else hash(session_id)
+        return self.stripes[index % len(self.stripes)]
+    
+    def _expired(self, meta, now):
+        return self.ttl is not None and now - meta[0] > self.ttl
+    
+    def _forget(self, session_id):
+        """从全局簿记中移除会话，返回是否存在；调用方需持有簿记锁"""
+        meta = self.order.pop(session_id, None)
+        if meta is None:
+            return False
+        self.bytes -= meta[1]
+        return True
+    
+    def _drop(self, session_ids):
+        """从各分条中删除已移出簿记的会话；调用方不能持有簿记锁"""
+        for session_id in session_ids:
+            stripe = self._stripe(session_id)
+            with stripe.lock:
+                stripe.mappings.pop(session_id, None)
+                stripe.engines.pop(session_id, None)
+    
+    def _evict(self, now):
+        """按全局LRU淘汰过期、超出会话数或内存上限的会话"""
+        victims = []
+        with self.lock:
+            order = self.order
+            if self.ttl is not None:
+                # 条目按最近访问时间排列，只需检查最前面的条目
+                while order and now - next(iter(order.values()))[0] > self.ttl:
+                    victims.append(next(iter(order)))
+                    self._forget(victims[-1])
+            while self.max_sessions and len(order) > self.max_sessions:
+                victims.append(next(iter(order)))
+                self._forget(victims[-1])
+            # 内存超限时至少保留最近的一个会话
+            while self.max_bytes and self.bytes > self.max_bytes and len(order) > 1:
+                victims.append(next(iter(order)))
+                self._forget(victims[-1])
+        self._drop(victims)
+    
+    def _touch(self, session_id, now):
+        """标记会话为最近访问；会话不存在或已过期时返回False"""
+        with self.lock:
+            meta = self.order.get(session_id)
+            if meta is None:
+                return False
+            expired = self._expired(meta, now)
+            if expired:
+                self._forget(session_id)
+            else:
+                meta[0] = now
+                self.order.move_to_end(session_id)
+        if expired:
+            self._drop((session_id,))
+        return not expired
+    
+    def create(self, mapping):
+        """保存映射并返回新的会话ID"""
+        session_id = f"session_{int(time.time())}_{next(self.ids)}"
+        size = self.mapping_size(mapping)
+        now = time.monotonic()
+        stripe = self._stripe(session_id)
+        with stripe.lock:
+            stripe.mappings[session_id] = mapping
+        with self.lock:
+            self.order[session_id] = [now, size]
+            self.bytes += size
+        # 限制会话数量和内存占用，避免内存泄漏
+        self._evict(now)
+        return session_id
+    
+    def update(self, session_id, mapping):
+        """保存会话映射的最新内容；内存存储中映射以引用保存，同一对象无需重复保存"""
+        if not self._touch(session_id, time.monotonic()):
+            return
+        stripe = self._stripe(session_id)
+        with stripe.lock:
+            if session_id in stripe.mappings and stripe.mappings[session_id] is not mapping:
+                stripe.mappings[session_id] = mapping
+                stripe.engines.pop(session_id, None)
+    
+    def get(self, session_id, default=None):
+        if not self._touch(session_id, time.monotonic()):
+            return default
+        stripe = self._stripe(session_id)
+        with stripe.lock:
+            return stripe.mappings.get(session_id, default)
+    
+    def __getitem__(self, session_id):
+        mapping = self.get(session_id)
+        if mapping is None:
+            raise KeyError(session_id)
+        return mapping
+    
+    def __contains__(self, session_id):
+        """只读的存在性检查：不更新访问顺序和访问时间"""
+        with self.lock:
+            meta = self.order.get(session_id)
+            return meta is not None and not self._expired(meta, time.monotonic())
+    
+    def __len__(self):
+        return len(self.order)
+    
+    def pop(self, session_id, default=None):
+        with self.lock:
+            found = self._forget(session_id)
+        if not found:
+            return default
+        stripe = self._stripe(session_id)
+        with stripe.lock:
+            stripe.engines.pop(session_id, None)
+            return stripe.mappings.pop(session_id, default)
+    
+    def restore_engine(self, session_id):
+        """获取会话的还原引擎，映射条目数变化时重新编译；会话不存在时返回None"""
+        now = time.monotonic()
+        if not self._touch(session_id, now):
+            return None
+        stripe = self._stripe(session_id)
+        with stripe.lock:
+            mapping = stripe.mappings.get(session_id)
+            engine = stripe.engines.get(session_id)
+        if mapping is None:
+            return None
+        if engine is not None and engine.size == len(mapping):
+            return engine
+        
+        # 在锁外编译，避免阻塞同一分条上的其他会话
+        engine = RestoreEngine(mapping)
+        size = self.mapping_size(mapping)
+        with stripe.lock:
+            if stripe.mappings.get(session_id) is not mapping:
+                return engine
+            stripe.engines[session_id] = engine
+        # 映射在创建后继续增长（如流式脱敏）时，同步更新内存占用并检查上限
+        with self.lock:
+            meta = self.order.get(session_id)
+            if meta is not None:
+                self.bytes += size - meta[1]
+                meta[1] = size
+        self._evict(now)
+        return engine
+
+class SQLiteSessionStore:
+    """基于SQLite的持久化会话存储，与 SessionStore 接口一致，可替换为端侧模型的会话存储
+    同一主机上的多个工作进程可共用一个数据库文件：WAL模式下读写互不阻塞，会话ID中带进程号避免冲突。
+    新建和更新的会话先缓存在内存中，攒够一批或超过刷新间隔后在一个事务中写入；SQL语句固定，由连接的预编译语句缓存复用。
+    后台刷新线程保证缓存的写入最迟在刷新间隔后落库，进程空闲时会话同样对其他进程可见
+    """
+    
+    CREATE_TABLE = ('CREATE TABLE IF NOT EXISTS sessions ('
+                    'session_id TEXT PRIMARY KEY, mapping BLOB NOT NULL, accessed REAL NOT NULL, size INTEGER NOT NULL)')
+    CREATE_INDEX = 'CREATE INDEX IF NOT EXISTS sessions_accessed ON sessions (accessed)'
+    UPSERT = ('INSERT INTO sessions (session_id, mapping, accessed, size) VALUES (?, ?, ?, ?) '
+              'ON CONFLICT(session_id) DO UPDATE SET mapping = excluded.mapping, accessed = excluded.accessed, size = excluded.size')
+    TOUCH = 'UPDATE sessions SET accessed = ? WHERE session_id = ?'
+    SELECT = 'SELECT mapping, accessed FROM sessions WHERE session_id = ?'
+    SELECT_ACCESSED = 'SELECT accessed FROM sessions WHERE session_id = ?'
+    DELETE = 'DELETE FROM sessions WHERE session_id = ?'
+    COUNT = 'SELECT COUNT(*) FROM sessions'
+    EXPIRE = 'DELETE FROM sessions WHERE accessed < ?'
+    EVICT_COUNT = ('DELETE FROM sessions WHERE session_id IN '
+                   '(SELECT session_id FROM sessions ORDER BY accessed DESC LIMIT -1 OFFSET ?)')
+    # 内存上限：按最近访问从新到旧累计大小，超出上限的会话被删除（至少保留最近的一个）
+    EVICT_BYTES = ('DELETE FROM sessions WHERE session_id IN (SELECT session_id FROM '
+                   '(SELECT session_id, size, SUM(size) OVER (ORDER BY accessed DESC) AS total FROM sessions) '
+                   'WHERE total > ? AND total > size)')
+    
+    def __init__(self, path, max_sessions=1000, ttl=None, max_bytes=None, batch_size=32, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.RLock()
+        # 每个线程使用独立的数据库连接；所有连接另记录在列表中，关闭时统一关闭
+        self.local = threading.local()
+        self.connections = []
+        # 尚未写入数据库的会话：会话ID -> 映射关系；以及尚未写入的访问时间
+        self.pending = OrderedDict()
+        self.pending_touches = {}
+        self.pending_since = None
+        # 会话ID -> 已编译的还原引擎，只保留最近使用的一部分
+        self.engines = OrderedDict()
+        self.engine_capacity = 256
+        self.ids = itertools.count(1)
+        # 后台刷新线程：有待写入的数据时被唤醒，等待一个刷新间隔后写入
+        self.flush_wakeup = threading.Event()
+        self.closed = threading.Event()
+        self.flusher = None
+        
+        with self._connection() as connection:
+            connection.execute(self.CREATE_TABLE)
+            connection.execute(self.CREATE_INDEX)
+        self.configure(max_sessions=max_sessions, ttl=ttl, max_bytes=max_bytes)
+        # 进程退出前写入缓存中的会话
+        atexit.register(self.flush)
+    
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            # 连接只在创建它的线程中使用，允许 close() 在其他线程中统一关闭
+            connection = sqlite3.connect(self.path, timeout=30, cached_statements=64, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+    
+    def _flush_loop(self):
+        """后台刷新：缓存开始积累后最多等待一个刷新间隔即写入数据库"""
+        while not self.closed.is_set():
+            self.flush_wakeup.wait()
+            if self.closed.wait(self.flush_interval):
+                break
+            self.flush_wakeup.clear()
+            self.flush()
+    
+    def _schedule_flush(self, now):
+        """记录缓存开始积累的时间并唤醒后台刷新线程（调用方持有锁）"""
+        if self.pending_since is not None:
+            return
+        self.pending_since = now
+        if self.flusher is None and not self.closed.is_set():
+            self.flusher = threading.Thread(target=self._flush_loop, name='session-store-flusher', daemon=True)
+            self.flusher.start()
+        self.flush_wakeup.set()
+    
+    @staticmethod
+    def dumps(mapping):
+        """序列化映射关系为紧凑的二进制格式"""
+        if not isinstance(mapping, CompactMapping):
+            mapping = CompactMapping(mapping)
+        return mapping.to_bytes()
+    
+    @staticmethod
+    def loads(data):
+        """从紧凑的二进制格式反序列化映射关系"""
+        return CompactMapping.from_bytes(data)
+    
+    def configure(self, max_sessions=1000, ttl=None, max_bytes=None):
+        """设置容量限制，含义与 SessionStore.configure 相同"""
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.flush()
+    
+    def flush(self):
+        """在一个事务中写入缓存的会话和访问时间，并按容量限制淘汰"""
+        with self.lock:
+            pending = [(session_id, self.dumps(mapping), now, SessionStore.mapping_size(mapping))
+                       for session_id, (mapping, now) in self.pending.items()]
+            touches = [(now, session_id) for session_id, now in self.pending_touches.items()]
+            self.pending.clear()
+            self.pending_touches.clear()
+            self.pending_since = None
+            
+            with self._connection() as connection:
+                connection.executemany(self.UPSERT, pending)
+                connection.executemany(self.TOUCH, touches)
+                if self.ttl is not None:
+                    connection.execute(self.EXPIRE, (time.time() - self.ttl,))
+                if self.max_sessions:
+                    connection.execute(self.EVICT_COUNT, (self.max_sessions,))
+                if self.max_bytes:
+                    connection.execute(self.EVICT_BYTES, (self.max_bytes,))
+    
+    def _maybe_flush(self, now):
+        if len(self.pending) >= self.batch_size or (
+                self.pending_since is not None and now - self.pending_since >= self.flush_interval):
+            self.flush()
+    
+    def create(self, mapping):
+        """保存映射并返回新的会话ID"""
+        session_id = f"session_{int(time.time())}_{os.getpid()}_{next(self.ids)}"
+        self.update(session_id, mapping)
+        return session_id
+    
+    def update(self, session_id, mapping):
+        """保存会话映射的最新内容（如流式脱敏过程中不断增长的映射），并丢弃按旧内容编译的还原引擎"""
+        now = time.time()
+        with self.lock:
+            self.pending[session_id] = (mapping, now)
+            self.pending.move_to_end(session_id)
+            self.engines.pop(session_id, None)
+            self._schedule_flush(now)
+            self._maybe_flush(now)
+    
+    def get(self, session_id, default=None):
+        now = time.time()
+        with self.lock:
+            entry = self.pending.get(session_id)
+            if entry is not None:
+                return entry[0]
+            touched = self.pending_touches.get(session_id, 0)
+        
+        # 数据库读取不持有锁；刷新在持有锁时完成，离开缓存的会话此时已经写入数据库
+        row = self._connection().execute(self.SELECT, (session_id,)).fetchone()
+        if row is None:
+            return default
+        data, accessed = row
+        if self.ttl is not None and now - max(accessed, touched) > self.ttl:
+            self.pop(session_id)
+            return default
+        
+        # 访问时间随下一批写入一起更新
+        with self.lock:
+            self.pending_touches[session_id] = now
+            self._schedule_flush(now)
+            self._maybe_flush(now)
+        return self.loads(data)
+    
+    def __getitem__(self, session_id):
+        mapping = self.get(session_id)
+        if mapping is None:
+            raise KeyError(session_id)
+        return mapping
+    
+    def __contains__(self, session_id):
+        """只读的存在性检查：不读取映射，也不更新访问时间"""
+        with self.lock:
+            if session_id in self.pending:
+                return True
+            touched = self.pending_touches.get(session_id, 0)
+        row = self._connection().execute(self.SELECT_ACCESSED, (session_id,)).fetchone()
+        return row is not None and (self.ttl is None or time.time() - max(row[0], touched) <= self.ttl)
+    
+    def __len__(self):
+        self.flush()
+        return self._connection().execute(self.COUNT).fetchone()[0]
+    
+    def pop(self, session_id, default=None):
+        with self.lock:
+            entry = self.pending.pop(session_id, None)
+            self.pending_touches.pop(session_id, None)
+            self.engines.pop(session_id, None)
+            row = self._connection().execute(self.SELECT, (session_id,)).fetchone()
+            with self._connection() as connection:
+                connection.execute(self.DELETE, (session_id,))
+        if entry is not None:
+            return entry[0]
+        return default if row is None else self.loads(row[0])
+    
+    def restore_engine(self, session_id):
+        """获取会话的还原引擎，映射条目数变化时重新编译；会话不存在时返回None"""
+        mapping = self.get(session_id)
+        if mapping is None:
+            return None
+        with self.lock:
+            engine = self.engines.get(session_id)
+            if engine is not None and engine.size == len(mapping):
+                self.engines.move_to_end(session_id)
+                return engine
+        
+        engine = RestoreEngine(mapping)
+        with self.lock:
+            self.engines[session_id] = engine
+            if len(self.engines) > self.engine_capacity:
+                self.engines.popitem(last=False)
+        return engine
+    
+    def close(self):
+        """停止后台刷新线程，写入缓存的会话并关闭所有线程打开的数据库连接"""
+        self.closed.set()
+        self.flush_wakeup.set()
+        if self.flusher is not None:
+            self.flusher.join()
+        self.flush()
+        atexit.unregister(self.flush)
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections.clear()
+        self.local = threading.local()
 
 class EntropyEnhancedSensitiveModel:
     def __init__(self):
@@ -28,6 +1318,42 @@ class EntropyEnhancedSensitiveModel:
         # 低于此长度的文本片段不会被单独分析，以避免误判短字符串
         self.min_token_len = 2
 
+        # 流式脱敏时每次读取的字符数，以及相邻窗口之间保留的重叠字符数
+        # 重叠窗口至少为可检测实体的最大长度，保证窗口边界附近的实体带着完整上下文再检测一次
+        self.stream_chunk_size = 64 * 1024
+        self.stream_overlap = 256
+
+        # 单文档分片并行检测：工作进程数大于1且文本长于分片长度时启用
+        # 文本在句末标点和换行处切分，每个分片两侧附带重叠边距，保证边界附近的实体带着上下文完整检测
+        self.shard_workers = 0
+        self.shard_size = 20000
+        self.shard_overlap = 256
+
+        # 会话缓存容量：会话数上限、过期时间（秒）和映射占用的内存上限（字节），None表示不限
+        # 超出上限时淘汰最久未访问的会话
+        self.max_sessions = 1000
+        self.session_ttl = None
+        self.max_session_bytes = None
+
+        # 持久化会话存储的SQLite数据库路径，None表示使用内存会话存储
+        # 设置后同一主机上的多个进程可共用会话，进程重启后会话仍可还原
+        self.session_db_path = None
+
+        # 会话中以紧凑格式（CompactMapping）保存映射关系，减少大量会话常驻内存时的对象开销
+        self.compact_session_mappings = False
+
+        # 跨请求的检测结果缓存（默认关闭）：最大条目数为0时不缓存，另以估算字节数限制总内存
+        self.detection_cache_size = 0
+        self.detection_cache_bytes = 64 * 1024 * 1024
+
+        # 候选片段熵值的计算后端：'auto' 在安装了NumPy时批量向量化计算，'numpy' 强制使用NumPy，'python' 使用逐token增量计算
+        # 'auto' 只对不短于 batch_entropy_min_length 的文本启用批量计算，短文本的数组开销高于逐个计算
+        self.entropy_backend = 'auto'
+        self.batch_entropy_min_length = 200
+
+        # 级联检测：先运行代价低的正则阶段，熵检测只枚举未被正则结果覆盖的区间
+        self.enable_detection_cascade = True
+
         # 控制是否启用激进分析模式
         # 激进分析会尝试更深入地挖掘潜在的敏感信息，但可能影响系统性能
         # 当前设为False以优先保证系统效率
@@ -66,6 +1392,29 @@ class EntropyEnhancedSensitiveModel:
         # 常见称谓和停用词
         self.MINOR_STOPWORDS = {'先生', '女士', '小姐', '同志', '经理', '总监', '总裁', '董事长', '总经理', '副总经理', '部门经理'}
         
+        # 职位关键词
+        self.POSITION_KEYWORDS = (
+            '经理', '总监', '总裁', '董事长', '总经理', '副总经理', '部门经理',
+            '主管', '专员', '工程师', '分析师', '顾问', '代表', '助理', '主任',
+            '副总裁', '助理总裁', '高级经理', '资深经理', '首席', 'CEO', 'CTO',
+            'CFO', 'COO', '总监助理', '副总监', '组长', '队长', '班长'
+        )
+        
+        # 部门关键词
+        self.DEPARTMENT_KEYWORDS = (
+            '部门', '部', '处', '科', '组', '室', '中心', '局', '所', '院',
+            '委员会', '办公室', '事业部', '项目部', '研发部', '市场部', '销售部',
+            '人力资源部', '财务部', '技术部', '产品部', '运营部', '客服部'
+        )
+        
+        # 通用敏感信息细分时使用的职位、部门和地址关键词
+        self.GENERAL_POSITION_KEYWORDS = ('经理', '总监', '总裁', '董事长', '总经理', '副总经理', '部门经理', '主管', '专员', '工程师', '分析师', '顾问', '代表')
+        self.GENERAL_DEPARTMENT_KEYWORDS = ('部门', '部', '处', '科', '组', '室')
+        self.ADDRESS_KEYWORDS = ('省', '市', '区', '县', '街道', '路', '号')
+        
+        # 所有关键词词典合并成一个自动机，每个文档只扫描一次
+        self._build_keyword_automaton()
+        
         # 位置权重配置
         self.position_weights = {
             'start': 1.5,  # 句子开头
@@ -75,9 +1424,66 @@ class EntropyEnhancedSensitiveModel:
             'after_comma': 1.1,  # 逗号后
         }
         
-        # 会话管理
-        self.sessions = {}
-        self.session_counter = 0
+        # 内置正则表达式：分词、熵检测阶段的结构化信息识别、启发式规则和数据泛化
+        self.builtin_patterns = {
+            'tokenizer': r'([\u4e00-\u9fa5]+)|([a-zA-Z0-9]+)|([，。！？；：""''（）【】《》]+)|([^\\s])',
+            'entropy.email': r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
+            'entropy.mobile': r'1[3-9]\d{9}',  # 手机号
+            'entropy.landline': r'\d{3,4}-\d{7,8}',  # 座机
+            'entropy.landline_area': r'\(\d{3,4}\)\s*\d{7,8}',  # 带区号的座机
+            'entropy.id_card': r'\b[1-9]\d{5}(19|20)\d{2}(0[1-9]|1[0-2])(0[1-9]|[12]\d|3[01])\d{3}[\dXx]\b',
+            'entropy.bank_card': r'\b\d{16,19}\b',
+            'entropy.ip': r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b',
+            'heuristic.alnum_run': r'[a-zA-Z0-9]{6,}',
+            'heuristic.digits': r'\d+',
+            'heuristic.latin': r'[a-zA-Z]',
+            'heuristic.ascii_digits': r'[0-9]+',
+            'heuristic.word': r'[a-zA-Z\u4e00-\u9fa5]+',
+            'generalize.amount': r'\d+(?:,\d{3})*(?:\.\d{1,2})?',
+            'generalize.number': r'\d+'
+        }
+        # 默认的启发式模式；保持默认时候选片段的判断改用字符类别索引，被替换后回退到正则匹配
+        self.default_heuristic_patterns = {name: source for name, source in self.builtin_patterns.items()
+                                           if name.startswith('heuristic.')}
+        # 默认的分词模式；保持默认且安装了NumPy时使用向量化分词器，被替换后回退到正则分词
+        self.default_tokenizer_pattern = self.builtin_patterns['tokenizer']
+        
+        # 合并扫描时正则类型的优先顺序：同一位置多种类型都能匹配时，优先选择更具体的类型
+        # 未列出的自定义类型排在最前
+        self.regex_type_priority = ('email', 'ip', 'id', 'bank_card', 'phone', 'performance', 'age', 'zipcode', 'amount')
+        
+        # 熵检测阶段的结构化识别规则：(内置模式名, 候选类型)，按顺序执行
+        self.entropy_structured_rules = (
+            ('entropy.email', 'email'),
+            ('entropy.mobile', 'phone'),
+            ('entropy.landline', 'phone'),
+            ('entropy.landline_area', 'phone'),
+            ('entropy.id_card', 'id_card'),
+            ('entropy.bank_card', 'bank_card'),
+            ('entropy.ip', 'ip_address')
+        )
+        
+        # 正则表达式注册表，所有模式在配置时预编译
+        self.pattern_registry = PatternRegistry()
+        self._sync_patterns()
+        
+        # 分片检测的常驻进程池，以及构建它时的 (检测配置指纹, 工作进程数)
+        self.shard_pool = None
+        self.shard_pool_key = None
+        
+        # 按所需敏感类型缓存的检测方案，配置变化时清空
+        self.detection_plans = {}
+        
+        # 检测结果缓存及当前配置的指纹
+        self.detection_cache = None
+        self.config_fingerprint = b''
+        self._update_detection_cache()
+        
+        # 级联检测各阶段的覆盖统计
+        self.cascade_stats = CascadeStats()
+        
+        # 会话管理：线程安全的分条会话存储，同时缓存各会话已编译的还原引擎
+        self.sessions = self._build_session_store()
         
         # 初始化脱敏策略
         self.desensitization_strategies = {
@@ -90,8 +1496,160 @@ class EntropyEnhancedSensitiveModel:
     def configure(self, **kwargs):
         """配置模型参数"""
         for key, value in kwargs.items():
-            if hasattr(self, key):
+            if key == 'sensitive_types':
+                self._update_sensitive_types(value)
+            elif hasattr(self, key):
                 setattr(self, key, value)
+        
+        # 会话存储后端变化时重建；容量变化时立即按新的上限淘汰
+        if 'session_db_path' in kwargs:
+            self.set_session_store(self._build_session_store())
+        elif any(key in kwargs for key in ('max_sessions', 'session_ttl', 'max_session_bytes')):
+            self.sessions.configure(self.max_sessions, ttl=self.session_ttl, max_bytes=self.max_session_bytes)
+        
+        # 配置变化后旧的检测结果和检测方案失效
+        self._update_detection_cache()
+        self.detection_plans.clear()
+        
+        # 只重新编译发生变化的模式
+        self._sync_patterns()
+        
+        # 关键词词典变化时重建自动机
+        if any(key in kwargs for key in ('COMPANY_SUFFIXES', 'POSITION_KEYWORDS', 'DEPARTMENT_KEYWORDS',
+                                         'GENERAL_POSITION_KEYWORDS', 'GENERAL_DEPARTMENT_KEYWORDS', 'ADDRESS_KEYWORDS')):
+            self._build_keyword_automaton()
+    
+    # 熵检测启发式规则能产生的类型：公司/姓名判断，以及按熵值区间的后续判断（含通用类型细分的结果）
+    IDENTITY_TYPES = frozenset(('company', 'name'))
+    TAIL_TYPES = frozenset(('account', 'structured_data', 'general', 'position', 'department', 'address',
+                            'mixed_content', 'chinese_phrase'))
+    
+    def _detection_plan(self, sensitive_types=None):
+        """返回只检测指定类型所需的检测方案；每种类型组合在同一配置下只规划一次"""
+        types = frozenset(sensitive_types) if sensitive_types else None
+        plan = self.detection_plans.get(types)
+        if plan is not None:
+            return plan
+        
+        if types is None:
+            plan = DetectionPlan(None, self.entropy_structured_rules, True, True, True, None, b'')
+        else:
+            identity = bool(types & self.IDENTITY_TYPES)
+            tail = bool(types & self.TAIL_TYPES)
+            plan = DetectionPlan(
+                types,
+                tuple(rule for rule in self.entropy_structured_rules if rule[1] in types),
+                identity or tail,
+                identity,
+                tail,
+                types | {'general'} if tail else types,
+                '\0'.join(sorted(types)).encode('utf-8')
+            )
+        self.detection_plans[types] = plan
+        return plan
+    
+    # 影响检测结果的配置项，用于计算检测缓存的配置指纹
+    DETECTION_CONFIG_ATTRIBUTES = (
+        'enable_entropy_detection', 'entropy_threshold', 'high_entropy_threshold', 'max_token_len', 'min_token_len',
+        'enable_radical_analysis', 'enable_position_entropy', 'enable_detection_cascade', 'sensitive_types', 'position_weights', 'builtin_patterns',
+        'COMMON_SURNAMES', 'COMPANY_SUFFIXES', 'MINOR_STOPWORDS', 'POSITION_KEYWORDS', 'DEPARTMENT_KEYWORDS',
+        'GENERAL_POSITION_KEYWORDS', 'GENERAL_DEPARTMENT_KEYWORDS', 'ADDRESS_KEYWORDS',
+        'regex_type_priority', 'entropy_structured_rules'
+    )
+    
+    def detection_config(self):
+        """返回影响检测结果的各配置项的当前值（含直接修改的属性），工作进程据此构建检测结果相同的模型"""
+        return {name: getattr(self, name) for name in self.DETECTION_CONFIG_ATTRIBUTES}
+    
+    def _detection_fingerprint(self):
+        """计算当前检测配置的指纹"""
+        values = [sorted(value) if isinstance(value, set) else value for value in self.detection_config().values()]
+        return hashlib.blake2b(repr(values).encode('utf-8'), digest_size=16).digest()
+    
+    def _update_detection_cache(self):
+        """重新计算配置指纹；指纹或缓存容量变化时清空检测缓存，指纹变化时同时清空检测方案"""
+        fingerprint = self._detection_fingerprint()
+        
+        cache = self.detection_cache
+        if not self.detection_cache_size:
+            self.detection_cache = None
+        elif (cache is None or cache.max_entries != self.detection_cache_size
+              or cache.max_bytes != self.detection_cache_bytes):
+            self.detection_cache = DetectionCache(self.detection_cache_size, self.detection_cache_bytes)
+        elif fingerprint != self.config_fingerprint:
+            cache.clear()
+        if fingerprint != self.config_fingerprint:
+            self.detection_plans.clear()
+        self.config_fingerprint = fingerprint
+    
+    def get_cascade_stats(self):
+        """获取级联检测的分阶段覆盖统计"""
+        return self.cascade_stats.get_stats()
+    
+    def get_detection_cache_stats(self):
+        """获取检测缓存的命中次数、未命中次数、条目数和估算字节数；未启用缓存时返回None"""
+        return self.detection_cache.get_stats() if self.detection_cache else None
+    
+    def _build_session_store(self):
+        """按配置构建会话存储：设置了数据库路径时使用SQLite持久化存储，否则使用内存存储"""
+        if self.session_db_path:
+            return SQLiteSessionStore(self.session_db_path, self.max_sessions,
+                                      ttl=self.session_ttl, max_bytes=self.max_session_bytes)
+        return SessionStore(self.max_sessions, ttl=self.session_ttl, max_bytes=self.max_session_bytes)
+    
+    def set_session_store(self, store):
+        """替换会话存储后端；自定义后端需提供与 SessionStore 相同的接口"""
+        close = getattr(self.sessions, 'close', None)
+        if close is not None:
+            close()
+        self.sessions = store
+    
+    def _build_keyword_automaton(self):
+        """根据公司后缀、职位、部门和地址关键词构建多关键词自动机"""
+        self.keyword_automaton = KeywordAutomaton({
+            'company': self.COMPANY_SUFFIXES,
+            'position': self.POSITION_KEYWORDS,
+            'department': self.DEPARTMENT_KEYWORDS,
+            'general_position': self.GENERAL_POSITION_KEYWORDS,
+            'general_department': self.GENERAL_DEPARTMENT_KEYWORDS,
+            'address': self.ADDRESS_KEYWORDS
+        })
+    
+    def _update_sensitive_types(self, sensitive_types):
+        """更新敏感信息类型配置
+        字典形式替换完整的类型配置；类型名称列表则只启用列出的类型
+        """
+        if isinstance(sensitive_types, dict):
+            self.sensitive_types = sensitive_types
+            return
+        
+        enabled_types = set(sensitive_types)
+        for sensitive_type, config in self.sensitive_types.items():
+            config['enable'] = sensitive_type in enabled_types
+    
+    def _sync_patterns(self):
+        """将内置模式和敏感类型的正则同步到注册表，未变化的模式不会重新编译"""
+        for name, source in self.builtin_patterns.items():
+            self.pattern_registry.register(name, source)
+        self.char_index_heuristics = all(self.builtin_patterns.get(name) == source
+                                         for name, source in self.default_heuristic_patterns.items())
+        self.vectorized_tokenizer = (np is not None and array('i').itemsize == 4 and
+                                     self.builtin_patterns.get('tokenizer') == self.default_tokenizer_pattern)
+        
+        active_names = set(self.builtin_patterns)
+        for sensitive_type, config in self.sensitive_types.items():
+            if config.get('regex'):
+                self.pattern_registry.register(sensitive_type, config['regex'])
+                active_names.add(sensitive_type)
+        
+        # 移除已删除或不再使用正则的类型；合并模式在扫描时按需更新，保留其编译结果和统计
+        for name in list(self.pattern_registry.patterns):
+            if name not in active_names and not name.startswith('combined.'):
+                self.pattern_registry.unregister(name)
+    
+    def get_pattern_stats(self):
+        """获取各正则模式的调用次数、命中次数和累计耗时"""
+        return self.pattern_registry.get_stats()
     
     def _char_entropy(self, text):
         """计算字符串的字符香农熵"""
@@ -129,9 +1687,10 @@ class EntropyEnhancedSensitiveModel:
         
         return entropy
     
-    def _position_entropy(self, text, position_info):
+    def _position_entropy(self, text, position_info, char_entropy=None):
         """计算位置相关的加权熵"""
-        base_entropy = self._char_entropy(text)
+        # 已有字符熵时直接复用，避免重复统计
+        base_entropy = self._char_entropy(text) if char_entropy is None else char_entropy
         
         # 应用位置权重，使用加权平均而不是只应用第一个匹配的权重
         total_weight = 0.0
@@ -151,12 +1710,35 @@ class EntropyEnhancedSensitiveModel:
         
         return base_entropy * avg_weight
     
-    def _tokenize_simple(self, text):
-        """简单分词，将文本按汉字串、字母数字串和其他字符分段"""
+    def _tokenize_simple(self, text, with_offsets=False):
+        """简单分词，将文本按汉字串、字母数字串和其他字符分段
+        with_offsets: 为True时同时返回每个token在原文中的起止位置，
+                      结果为 (tokens, starts, ends)，starts/ends 为 array('i')
+        """
         # 使用正则表达式进行简单分词
         # 匹配汉字、字母数字、标点符号和其他字符
-        pattern = r'([\u4e00-\u9fa5]+)|([a-zA-Z0-9]+)|([，。！？；：""''（）【】《》]+)|([^\\s])'
-        tokens = re.findall(pattern, text)
+        pattern = self.pattern_registry.compiled('tokenizer')
+        
+        # 默认分词规则下用码点分类向量化切分，只在Python中按边界切出token字符串
+        if self.vectorized_tokenizer:
+            token_starts, token_ends = CodepointTokenizer.tokenize(text)
+            tokens = [text[start:end] for start, end in zip(token_starts.tolist(), token_ends.tolist())]
+            if with_offsets:
+                return tokens, array('i', token_starts.tobytes()), array('i', token_ends.tobytes())
+            return tokens
+        
+        if with_offsets:
+            # 每个分支都是整体捕获组，整个匹配即为非空的那一组
+            tokens = []
+            starts = array('i')
+            ends = array('i')
+            for match in self.pattern_registry.finditer('tokenizer', text):
+                tokens.append(match.group())
+                starts.append(match.start())
+                ends.append(match.end())
+            return tokens, starts, ends
+        
+        tokens = pattern.findall(text)
         
         # 合并匹配结果
         result = []
@@ -169,14 +1751,18 @@ class EntropyEnhancedSensitiveModel:
         
         return result
     
-    def _is_chinese_name(self, text):
-        """检测是否为中文姓名"""
+    def _is_chinese_name(self, text, all_cjk=None):
+        """检测是否为中文姓名
+        all_cjk: 可选，由字符类别索引得到的“是否全是中文字符”，提供时不再逐字符检查
+        """
         # 姓名长度通常为2-4个字符
         if len(text) < 2 or len(text) > 4:
             return False
         
         # 检查是否全是中文字符
-        if not all('\u4e00' <= char <= '\u9fff' for char in text):
+        if all_cjk is None:
+            all_cjk = all('\u4e00' <= char <= '\u9fff' for char in text)
+        if not all_cjk:
             return False
         
         # 检查第一个字符是否为常见姓氏
@@ -191,46 +1777,44 @@ class EntropyEnhancedSensitiveModel:
         # 如果不包含常见名字用字，但长度合适且第一个字符是常见姓氏，也可能是姓名
         return len(text) >= 2 and len(text) <= 3
     
-    def _is_position_or_department(self, text):
-        """检测是否为职位或部门"""
-        # 职位关键词
-        position_keywords = [
-            '经理', '总监', '总裁', '董事长', '总经理', '副总经理', '部门经理',
-            '主管', '专员', '工程师', '分析师', '顾问', '代表', '助理', '主任',
-            '副总裁', '助理总裁', '高级经理', '资深经理', '首席', 'CEO', 'CTO',
-            'CFO', 'COO', '总监助理', '副总监', '组长', '队长', '班长'
-        ]
-        
-        # 部门关键词
-        department_keywords = [
-            '部门', '部', '处', '科', '组', '室', '中心', '局', '所', '院',
-            '委员会', '办公室', '事业部', '项目部', '研发部', '市场部', '销售部',
-            '人力资源部', '财务部', '技术部', '产品部', '运营部', '客服部'
-        ]
+    def _is_position_or_department(self, text, keyword_index=None, start=0, end=None):
+        """检测是否为职位或部门
+        keyword_index: 文档级关键词索引，提供时按 [start, end) 区间查询，无需重新扫描文本
+        """
+        if keyword_index is None:
+            keyword_index = self.keyword_automaton.index(text)
+            start, end = 0, len(text)
         
         # 检查是否包含职位关键词
-        for keyword in position_keywords:
-            if keyword in text:
-                return 'position'
+        if keyword_index.contains('position', start, end):
+            return 'position'
         
         # 检查是否包含部门关键词
-        for keyword in department_keywords:
-            if keyword in text:
-                return 'department'
+        if keyword_index.contains('department', start, end):
+            return 'department'
         
         return None
     
-    def _process_candidate(self, text, candidate_text, start_token_idx, end_token_idx, tokens, candidates):
-        """处理候选文本，判断是否为敏感信息"""
+    def score_candidate(self, text, start, end, entropies=None, keyword_index=None, char_index=None, plan=None):
+        """对文本中 [start, end) 区间的候选片段进行评分，判断是否为敏感信息
+        entropies: 可选的 (字符熵, 二元组熵, 三元组熵)，由增量熵计算器提供时不再重新统计
+        keyword_index: 可选的文档级关键词索引，未提供时只扫描候选片段本身
+        char_index: 可选的文档级字符类别索引，未提供时只为候选片段本身构建
+        plan: 可选的检测方案，未被需要的类型视为不敏感
+        返回 CandidateScore 记录，type 为 None 表示该片段不敏感
+        """
+        candidate_text = text[start:end]
+        
         # 获取位置信息
-        start_idx = text.find(candidate_text)
-        end_idx = start_idx + len(candidate_text)
-        position_info = self._get_position_info(text, start_idx, end_idx)
+        position_info = self._get_position_info(text, start, end, char_index)
         
         # 计算综合熵值
-        char_entropy = self._char_entropy(candidate_text)
-        bigram_entropy = self._ngram_entropy(candidate_text, 2)
-        trigram_entropy = self._ngram_entropy(candidate_text, 3) if len(candidate_text) >= 3 else 0
+        if entropies is not None:
+            char_entropy, bigram_entropy, trigram_entropy = entropies
+        else:
+            char_entropy = self._char_entropy(candidate_text)
+            bigram_entropy = self._ngram_entropy(candidate_text, 2)
+            trigram_entropy = self._ngram_entropy(candidate_text, 3) if len(candidate_text) >= 3 else 0
         
         # 综合不同粒度的熵值，根据文本长度调整权重
         if len(candidate_text) <= 4:
@@ -245,78 +1829,161 @@ class EntropyEnhancedSensitiveModel:
         
         # 应用位置权重
         if self.enable_position_entropy:
-            position_entropy = self._position_entropy(candidate_text, position_info)
+            position_entropy = self._position_entropy(candidate_text, position_info, char_entropy)
             # 混合原始熵和位置熵
             combined_entropy = (combined_entropy * 0.7 + position_entropy * 0.3)
         
+        if keyword_index is None:
+            sensitive_type = self._classify_candidate(candidate_text, combined_entropy,
+                                                      self.keyword_automaton.index(candidate_text), 0,
+                                                      CharClassIndex(candidate_text), plan)
+        else:
+            if char_index is None:
+                char_index = CharClassIndex(candidate_text, start)
+            sensitive_type = self._classify_candidate(candidate_text, combined_entropy, keyword_index, start, char_index, plan)
+        return CandidateScore(candidate_text, start, end, combined_entropy, sensitive_type)
+    
+    def _heuristic(self, name, candidate_text, char_index, start, end):
+        """候选片段是否匹配指定的启发式模式：默认模式查字符类别索引，自定义模式使用正则"""
+        if self.char_index_heuristics:
+            return char_index.contains(name, start, end)
+        return self.pattern_registry.search(name, candidate_text) is not None
+    
+    def _classify_candidate(self, candidate_text, combined_entropy, keyword_index, start, char_index, plan=None):
+        """根据综合熵值和启发式规则确定候选片段的敏感类型，非敏感时返回None
+        keyword_index/char_index/start: 关键词索引、字符类别索引及候选片段在被索引文本中的起始位置
+        plan: 可选的检测方案，结果类型全部未被需要的判断分支直接跳过
+        """
+        end = start + len(candidate_text)
+        heuristic = self._heuristic
+        
         # 启发式规则判断
-        is_sensitive = False
         sensitive_type = None
         
         # 公司名称检测
-        if any(suffix in candidate_text for suffix in self.COMPANY_SUFFIXES):
-            is_sensitive = True
+        if plan is not None and not plan.identity:
+            pass
+        elif keyword_index.contains('company', start, end):
             sensitive_type = 'company'
         # 姓名检测 - 使用专门的姓名检测方法
-        elif self._is_chinese_name(candidate_text):
-            is_sensitive = True
+        elif self._is_chinese_name(candidate_text, char_index.all_cjk(start, end)):
             sensitive_type = 'name'
         # 职位和部门检测 - 使用专门的检测方法
-        position_or_dept = self._is_position_or_department(candidate_text)
+        position_or_dept = self._is_position_or_department(candidate_text, keyword_index, start, end)
         if position_or_dept:
-            is_sensitive = True
             sensitive_type = position_or_dept
+        # 后续按熵值区间的判断都不需要时保留上面的结果
+        elif plan is not None and not plan.tail:
+            pass
         # 账号/标识检测（高熵值）- 改进规则
-        elif combined_entropy > self.high_entropy_threshold and re.search(r'[a-zA-Z0-9]{6,}', candidate_text):
-            is_sensitive = True
+        elif combined_entropy > self.high_entropy_threshold and heuristic('heuristic.alnum_run', candidate_text, char_index, start, end):
             sensitive_type = 'account'
         # 低熵值文本可能包含结构化信息 - 改进规则
         elif combined_entropy < self.entropy_threshold and len(candidate_text) >= 4:
             # 进一步判断是否为结构化信息
-            if (re.search(r'\d+', candidate_text) and 
-                (re.search(r'[a-zA-Z]', candidate_text) or 
-                 any(char in candidate_text for char in '-_'))):
-                is_sensitive = True
+            if (heuristic('heuristic.digits', candidate_text, char_index, start, end) and 
+                (heuristic('heuristic.latin', candidate_text, char_index, start, end) or 
+                 char_index.contains('dash', start, end))):
                 sensitive_type = 'structured_data'
             # 或者是常见的结构化中文文本
             elif (len(candidate_text) >= 4 and len(candidate_text) <= 10 and 
-                  not any(char in candidate_text for char in '，。！？；：""''（）【】《》')):
-                is_sensitive = True
+                  not char_index.contains('punctuation', start, end)):
                 sensitive_type = 'general'
         # 中等熵值文本检测 - 新增规则
         elif (self.entropy_threshold <= combined_entropy <= self.high_entropy_threshold and 
               len(candidate_text) >= 3 and len(candidate_text) <= 8):
             # 检查是否包含特定模式
-            if (re.search(r'[0-9]+', candidate_text) and 
-                re.search(r'[a-zA-Z\u4e00-\u9fa5]+', candidate_text)):
-                is_sensitive = True
+            if (heuristic('heuristic.ascii_digits', candidate_text, char_index, start, end) and 
+                heuristic('heuristic.word', candidate_text, char_index, start, end)):
                 sensitive_type = 'mixed_content'
             # 或者是常见的中文词组
-            elif (len(candidate_text) >= 4 and 
-                  all('\u4e00' <= char <= '\u9fff' for char in candidate_text)):
-                is_sensitive = True
+            elif len(candidate_text) >= 4 and char_index.all_cjk(start, end):
                 sensitive_type = 'chinese_phrase'
         
-        if is_sensitive:
+        if plan is not None and plan.accepts is not None and sensitive_type not in plan.accepts:
+            return None
+        return sensitive_type
+    
+    def _use_batch_entropy(self, text):
+        """是否使用NumPy批量计算候选片段的熵值"""
+        if self.entropy_backend == 'python' or np is None:
+            return False
+        return self.entropy_backend == 'numpy' or len(text) >= self.batch_entropy_min_length
+    
+    def _batch_combined_entropy(self, text, starts, ends, char_index):
+        """批量计算候选区间的综合熵值（含位置熵），与 score_candidate 的逐个计算结果一致
+        char_index: 整个文档的字符类别索引，用于向量化判断句子边界
+        """
+        batch_entropy = BatchEntropy(text)
+        char_entropy, bigram_entropy, trigram_entropy = batch_entropy.entropies(starts, ends)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        lengths = ends - starts
+        
+        # 综合不同粒度的熵值，根据文本长度调整权重
+        combined = np.where(
+            lengths <= 4, char_entropy * 0.7 + bigram_entropy * 0.2 + trigram_entropy * 0.1,
+            np.where(lengths <= 8, char_entropy * 0.5 + bigram_entropy * 0.3 + trigram_entropy * 0.2,
+                     char_entropy * 0.3 + bigram_entropy * 0.4 + trigram_entropy * 0.3))
+        
+        if self.enable_position_entropy:
+            # 位置类别与 _get_position_info 相同：句首/句尾/句中，以及是否紧跟冒号或逗号
+            terminals = np.frombuffer(bytes(char_index.terminals) + b'\0', dtype=np.uint8)
+            at_start = (starts == 0) | (terminals[starts - 1] == 1)
+            at_end = ~at_start & ((ends == len(text)) | (terminals[ends] == 1))
+            previous = np.where(starts > 0, batch_entropy.codes[0][starts - 1], -1)
+            masks = {
+                'start': at_start,
+                'end': at_end,
+                'middle': ~(at_start | at_end),
+                'after_colon': previous == ord(':'),
+                'after_comma': previous == ord(','),
+            }
+            # 按 position_weights 的顺序累加匹配位置的权重，求平均后乘以字符熵
+            weighted_sum = np.zeros(len(starts))
+            total_weight = np.zeros(len(starts))
+            for pos_type, pos_weight in self.position_weights.items():
+                mask = masks.get(pos_type)
+                if mask is not None:
+                    weighted_sum = np.where(mask, weighted_sum + pos_weight, weighted_sum)
+                    total_weight = np.where(mask, total_weight + 1, total_weight)
+            matched = total_weight > 0
+            position_entropy = np.where(matched, char_entropy * (weighted_sum / np.where(matched, total_weight, 1)), char_entropy)
+            combined = combined * 0.7 + position_entropy * 0.3
+        return combined
+    
+    def _process_candidate(self, text, start_idx, end_idx, start_token_idx, end_token_idx, candidates, entropies=None, keyword_index=None, char_index=None, plan=None):
+        """对token组合形成的候选片段评分，敏感时加入候选列表"""
+        score = self.score_candidate(text, start_idx, end_idx, entropies, keyword_index, char_index, plan)
+        if score.type:
             candidates.append({
-                'text': candidate_text,
-                'start': start_idx,
-                'end': end_idx,
-                'entropy': combined_entropy,
-                'type': sensitive_type,
+                'text': score.text,
+                'start': score.start,
+                'end': score.end,
+                'entropy': score.entropy,
+                'type': score.type,
                 'token_start': start_token_idx,
                 'token_end': end_token_idx
             })
     
-    def _get_position_info(self, text, start_idx, end_idx):
-        """获取文本位置信息"""
+    def _get_position_info(self, text, start_idx, end_idx, char_index=None):
+        """获取文本位置信息
+        char_index: 可选的文档级字符类别索引，提供时句子边界直接查句末标点标记
+        """
         position_info = set()
         
+        if char_index is not None:
+            at_start = char_index.after_terminal(start_idx)
+            at_end = not at_start and char_index.before_terminal(end_idx, len(text))
+        else:
+            at_start = start_idx == 0 or text[start_idx-1] in '。！？'
+            at_end = not at_start and (end_idx == len(text) or text[end_idx] in '。！？')
+        
         # 检查是否在句子开头
-        if start_idx == 0 or text[start_idx-1] in '。！？':
+        if at_start:
             position_info.add('start')
         # 检查是否在句子结尾
-        elif end_idx == len(text) or text[end_idx] in '。！？':
+        elif at_end:
             position_info.add('end')
         # 检查是否在句子中间
         else:
@@ -331,284 +1998,300 @@ class EntropyEnhancedSensitiveModel:
         
         return position_info
     
-    def _entropy_detect_candidates(self, text):
-        """基于信息熵和启发式规则检测敏感信息候选"""
+    def _entropy_detect_candidates(self, text, structured_candidates=None, keyword_index=None, covered=None, plan=None):
+        """基于信息熵和启发式规则检测敏感信息候选
+        structured_candidates: 合并扫描得到的结构化候选，未提供时单独扫描一次
+        keyword_index: 文档级关键词索引，未提供时在此构建
+        covered: 可选，已被前一阶段覆盖的区间集合；只枚举完全落在未覆盖空隙内的token组合
+        plan: 可选的检测方案，所需类型都不来自启发式规则时只保留结构化候选
+        """
         if not text or not self.enable_entropy_detection:
             return []
         
         candidates = []
-        tokens = self._tokenize_simple(text)
+        if plan is None or plan.entropy:
+            # 关键词自动机对整个文档只扫描一次，各候选片段按区间查询
+            if keyword_index is None:
+                keyword_index = self.keyword_automaton.index(text)
+            
+            # 字符类别索引同样只构建一次，候选片段的启发式判断和标点占比都是O(1)查询
+            char_index = CharClassIndex(text)
+            
+            # 分词时记录每个token的起止位置，片段位置直接由token下标得到，无需在原文中查找
+            tokens, starts, ends = self._tokenize_simple(text, with_offsets=True)
+        else:
+            # 跳过分词和候选枚举
+            char_index = None
+            tokens, starts, ends = [], array('i'), array('i')
+        
+        # NumPy后端先收集全部候选区间，再一次性批量计算熵值
+        batch = self._use_batch_entropy(text)
+        spans = []
+        
+        # 分词仍针对整个文档，token边界与上下文不受覆盖区间影响；级联模式下只取完全落在空隙内的token下标范围
+        if covered is None:
+            token_ranges = [(0, len(tokens))]
+        else:
+            token_ranges = [(bisect_left(starts, gap_start), bisect_right(ends, gap_end))
+                            for gap_start, gap_end in covered.gaps(0, len(text))]
         
         # 遍历所有可能的token组合作为候选
-        for i in range(len(tokens)):
-            # 单个token作为候选
-            candidate_text = tokens[i]
-            if len(candidate_text) >= self.min_token_len:
-                self._process_candidate(text, candidate_text, i, i, tokens, candidates)
-            
-            # 多个token组合作为候选
-            for j in range(i+1, min(i+self.max_token_len//2, len(tokens))):
-                # 跳过标点符号开头的组合
-                if tokens[i] in ['，', '。', '！', '？', '；', '：', '"', "'", '（', '）', '【', '】', '《', '》']:
-                    break
-                
-                candidate_text = ''.join(tokens[i:j+1])
-                
-                # 跳过太短的候选
-                if len(candidate_text) < self.min_token_len:
-                    continue
-                
-                # 跳过包含太多标点符号的候选
-                punctuation_count = sum(1 for char in candidate_text if char in '，。！？；：""''（）【】《》')
-                if punctuation_count > len(candidate_text) * 0.3:  # 如果标点符号占比超过30%
-                    continue
-                
-                self._process_candidate(text, candidate_text, i, j, tokens, candidates)
+        for first, last in token_ranges:
+            for i in range(first, last):
+                # 以第i个token为起点的增量熵计算器，向右扩展时只统计新增的字符
+                engine = None if batch else IncrementalEntropy()
+                if engine:
+                    engine.push(tokens[i])
                 
-                # 获取位置信息
-                start_idx = text.find(candidate_text)
-                end_idx = start_idx + len(candidate_text)
-                position_info = self._get_position_info(text, start_idx, end_idx)
-                
-                # 计算综合熵值
-                char_entropy = self._char_entropy(candidate_text)
-                bigram_entropy = self._ngram_entropy(candidate_text, 2)
-                trigram_entropy = self._ngram_entropy(candidate_text, 3) if len(candidate_text) >= 3 else 0
-                
-                # 综合不同粒度的熵值，根据文本长度调整权重
-                if len(candidate_text) <= 4:
-                    # 短文本更依赖字符熵
-                    combined_entropy = (char_entropy * 0.7 + bigram_entropy * 0.2 + trigram_entropy * 0.1)
-                elif len(candidate_text) <= 8:
-                    # 中等长度文本平衡考虑
-                    combined_entropy = (char_entropy * 0.5 + bigram_entropy * 0.3 + trigram_entropy * 0.2)
-                else:
-                    # 长文本更依赖n-gram熵
-                    combined_entropy = (char_entropy * 0.3 + bigram_entropy * 0.4 + trigram_entropy * 0.3)
-                
-                # 应用位置权重
-                if self.enable_position_entropy:
-                    position_entropy = self._position_entropy(candidate_text, position_info)
-                    # 混合原始熵和位置熵
-                    combined_entropy = (combined_entropy * 0.7 + position_entropy * 0.3)
-                
-                # 启发式规则判断
-                is_sensitive = False
-                sensitive_type = None
-                
-                # 公司名称检测
-                if any(suffix in candidate_text for suffix in self.COMPANY_SUFFIXES):
-                    is_sensitive = True
-                    sensitive_type = 'company'
-                # 姓名检测 - 使用专门的姓名检测方法
-                elif self._is_chinese_name(candidate_text):
-                    is_sensitive = True
-                    sensitive_type = 'name'
-                # 职位和部门检测 - 使用专门的检测方法
-                position_or_dept = self._is_position_or_department(candidate_text)
-                if position_or_dept:
-                    is_sensitive = True
-                    sensitive_type = position_or_dept
-                # 账号/标识检测（高熵值）- 改进规则
-                elif combined_entropy > self.high_entropy_threshold and re.search(r'[a-zA-Z0-9]{6,}', candidate_text):
-                    is_sensitive = True
-                    sensitive_type = 'account'
-                # 低熵值文本可能包含结构化信息 - 改进规则
-                elif combined_entropy < self.entropy_threshold and len(candidate_text) >= 4:
-                    # 进一步判断是否为结构化信息
-                    if (re.search(r'\d+', candidate_text) and 
-                        (re.search(r'[a-zA-Z]', candidate_text) or 
-                         any(char in candidate_text for char in '-_'))):
-                        is_sensitive = True
-                        sensitive_type = 'structured_data'
-                    # 或者是常见的结构化中文文本
-                    elif (len(candidate_text) >= 4 and len(candidate_text) <= 10 and 
-                          not any(char in candidate_text for char in '，。！？；：""''（）【】《》')):
-                        is_sensitive = True
-                        sensitive_type = 'general'
-                # 中等熵值文本检测 - 新增规则
-                elif (self.entropy_threshold <= combined_entropy <= self.high_entropy_threshold and 
-                      len(candidate_text) >= 3 and len(candidate_text) <= 8):
-                    # 检查是否包含特定模式
-                    if (re.search(r'[0-9]+', candidate_text) and 
-                        re.search(r'[a-zA-Z\u4e00-\u9fa5]+', candidate_text)):
-                        is_sensitive = True
-                        sensitive_type = 'mixed_content'
-                    # 或者是常见的中文词组
-                    elif (len(candidate_text) >= 4 and 
-                          all('\u4e00' <= char <= '\u9fff' for char in candidate_text)):
-                        is_sensitive = True
-                        sensitive_type = 'chinese_phrase'
+                # 单个token作为候选
+                start_idx = starts[i]
+                if ends[i] - start_idx >= self.min_token_len:
+                    if batch:
+                        spans.append((start_idx, ends[i], i, i))
+                    else:
+                        self._process_candidate(text, start_idx, ends[i], i, i, candidates, engine.entropies(), keyword_index, char_index, plan)
                 
-                if is_sensitive:
+                # 多个token组合作为候选
+                for j in range(i+1, min(i+self.max_token_len//2, last)):
+                    # 跳过标点符号开头的组合
+                    if tokens[i] in ['，', '。', '！', '？', '；', '：', '"', "'", '（', '）', '【', '】', '《', '》']:
+                        break
+                    
+                    # 候选片段必须是原文中的连续区间，遇到token之间的空白即停止扩展
+                    if starts[j] != ends[j-1]:
+                        break
+                    
+                    if engine:
+                        engine.push(tokens[j])
+                    candidate_len = ends[j] - start_idx
+                    
+                    # 跳过太短的候选
+                    if candidate_len < self.min_token_len:
+                        continue
+                    
+                    # 跳过包含太多标点符号的候选
+                    if char_index.count('punctuation', start_idx, ends[j]) > candidate_len * 0.3:  # 如果标点符号占比超过30%
+                        continue
+                    
+                    if batch:
+                        spans.append((start_idx, ends[j], i, j))
+                    else:
+                        self._process_candidate(text, start_idx, ends[j], i, j, candidates, engine.entropies(), keyword_index, char_index, plan)
+        
+        if spans:
+            span_starts, span_ends, _, _ = zip(*spans)
+            combined = self._batch_combined_entropy(text, span_starts, span_ends, char_index)
+            for (start_idx, end_idx, i, j), combined_entropy in zip(spans, combined.tolist()):
+                candidate_text = text[start_idx:end_idx]
+                sensitive_type = self._classify_candidate(candidate_text, combined_entropy, keyword_index, start_idx, char_index, plan)
+                if sensitive_type:
                     candidates.append({
                         'text': candidate_text,
                         'start': start_idx,
                         'end': end_idx,
                         'entropy': combined_entropy,
-                        'type': sensitive_type
+                        'type': sensitive_type,
+                        'token_start': i,
+                        'token_end': j
                     })
         
-        # 添加更多检测规则
-        # 邮箱检测
-        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-        for match in re.finditer(email_pattern, text):
-            candidate_text = match.group()
-            if len(candidate_text) >= self.min_token_len:
-                candidates.append({
-                    'text': candidate_text,
-                    'start': match.start(),
-                    'end': match.end(),
-                    'entropy': self._char_entropy(candidate_text),
-                    'type': 'email',
-                    'token_start': -1,
-                    'token_end': -1
-                })
-        
-        # 电话号码检测
-        phone_patterns = [
-            r'1[3-9]\d{9}',  # 手机号
-            r'\d{3,4}-\d{7,8}',  # 座机
-            r'\(\d{3,4}\)\s*\d{7,8}'  # 带区号的座机
-        ]
-        for pattern in phone_patterns:
-            for match in re.finditer(pattern, text):
-                candidate_text = match.group()
-                if len(candidate_text) >= self.min_token_len:
-                    candidates.append({
-                        'text': candidate_text,
-                        'start': match.start(),
-                        'end': match.end(),
-                        'entropy': self._char_entropy(candidate_text),
-                        'type': 'phone',
-                        'token_start': -1,
-                        'token_end': -1
-                    })
-        
-        # 身份证号检测
-        id_pattern = r'\b[1-9]\d{5}(19|20)\d{2}(0[1-9]|1[0-2])(0[1-9]|[12]\d|3[01])\d{3}[\dXx]\b'
-        for match in re.finditer(id_pattern, text):
-            candidate_text = match.group()
-            if len(candidate_text) >= self.min_token_len:
-                candidates.append({
-                    'text': candidate_text,
-                    'start': match.start(),
-                    'end': match.end(),
-                    'entropy': self._char_entropy(candidate_text),
-                    'type': 'id_card',
-                    'token_start': -1,
-                    'token_end': -1
-                })
-        
-        # 银行卡号检测
-        bank_card_pattern = r'\b\d{16,19}\b'
-        for match in re.finditer(bank_card_pattern, text):
-            candidate_text = match.group()
-            if len(candidate_text) >= self.min_token_len:
-                candidates.append({
-                    'text': candidate_text,
-                    'start': match.start(),
-                    'end': match.end(),
-                    'entropy': self._char_entropy(candidate_text),
-                    'type': 'bank_card',
-                    'token_start': -1,
-                    'token_end': -1
-                })
-        
-        # IP地址检测
-        ip_pattern = r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b'
-        for match in re.finditer(ip_pattern, text):
-            candidate_text = match.group()
-            if len(candidate_text) >= self.min_token_len:
-                candidates.append({
-                    'text': candidate_text,
-                    'start': match.start(),
-                    'end': match.end(),
-                    'entropy': self._char_entropy(candidate_text),
-                    'type': 'ip_address',
-                    'token_start': -1,
-                    'token_end': -1
-                })
+        # 添加更多检测规则：邮箱、电话号码、身份证号、银行卡号、IP地址等结构化信息
+        if structured_candidates is None:
+            _, structured_candidates = self._scan_patterns(text, include_regex=False, plan=plan)
+        if covered is not None:
+            structured_candidates = [candidate for candidate in structured_candidates
+                                     if not covered.overlaps(candidate['start'], candidate['end'])]
+        candidates.extend(structured_candidates)
         
         # 按熵值和长度排序，优先选择熵值高、长度长的候选
         candidates.sort(key=lambda x: (x['entropy'], len(x['text'])), reverse=True)
         
         # 去重，保留最长的匹配
         unique_candidates = []
-        covered_positions = set()
+        covered_spans = IntervalSet()
         
         for candidate in candidates:
             # 检查是否与已选择的候选重叠
-            overlap = False
-            for pos in range(candidate['start'], candidate['end']):
-                if pos in covered_positions:
-                    overlap = True
-                    break
-            
-            if not overlap:
+            if not covered_spans.overlaps(candidate['start'], candidate['end']):
                 unique_candidates.append(candidate)
-                # 标记覆盖的位置
-                for pos in range(candidate['start'], candidate['end']):
-                    covered_positions.add(pos)
+                # 标记覆盖的区间
+                covered_spans.add(candidate['start'], candidate['end'])
         
         return unique_candidates
     
-    def _regex_detect_sensitive(self, text):
-        """使用正则表达式检测敏感信息"""
-        sensitive_matches = []
-        
-        for sensitive_type, config in self.sensitive_types.items():
-            if not config['enable'] or not config['regex']:
+    def _combinable(self, source):
+        """判断模式能否并入合并扫描：含数字反向引用或可匹配空串的模式需要单独扫描"""
+        if re.search(r'\\[1-9]', source):
+            return False
+        return self.pattern_registry.compiled_source(source).fullmatch('') is None
+    
+    def _build_combined_pattern(self, stage, plan=None):
+        """构建某一阶段的合并多模式正则，每个模式作为一个命名分组
+        stage: 'regex' 合并启用的正则类型，'structured' 合并熵检测阶段的结构化规则
+        两个阶段各自扫描，结构化规则中更早开始的匹配不会截断正则类型的匹配
+        plan: 可选的检测方案，只合并所需类型的正则和结构化规则
+        返回 (注册表中的名称, 分组名 -> (阶段, 模式名, 类型) 的映射, 需要单独扫描的模式列表)
+        """
+        entries = []
+        if stage == 'regex':
+            enabled = [name for name, config in self.sensitive_types.items()
+                       if config['enable'] and config['regex']
+                       and (plan is None or plan.types is None or name in plan.types)]
+            priority = {name: idx for idx, name in enumerate(self.regex_type_priority)}
+            enabled.sort(key=lambda name: priority.get(name, -1))
+            entries.extend(('regex', name, name) for name in enabled)
+        elif self.enable_entropy_detection:
+            rules = self.entropy_structured_rules if plan is None else plan.structured_rules
+            entries.extend(('structured', pattern_name, candidate_type)
+                           for pattern_name, candidate_type in rules)
+        
+        parts = []
+        labels = {}
+        separate = []
+        for entry in entries:
+            source = self.pattern_registry.patterns[entry[1]][0]
+            if not self._combinable(source):
+                separate.append(entry)
                 continue
-            
-            pattern = config['regex']
-            matches = re.finditer(pattern, text)
-            
-            for match in matches:
-                sensitive_matches.append({
-                    'text': match.group(),
+            group_name = f'g{len(parts)}'
+            parts.append(f'(?P<{group_name}>{source})')
+            labels[group_name] = entry
+        
+        combined_name = f'combined.{stage}'
+        if plan is not None and plan.types is not None:
+            combined_name += '.' + plan.key.hex()
+        if parts:
+            try:
+                self.pattern_registry.register(combined_name, '|'.join(parts))
+            except re.error:
+                # 模式之间存在冲突（如重名分组、全局标志），退回逐个扫描
+                return None, {}, entries
+        return combined_name, labels, separate
+    
+    def _scan_patterns(self, text, include_regex=True, include_structured=True, plan=None):
+        """正则类型和结构化规则各用一个合并的正则扫描一次，返回带类型标签的匹配
+        两个阶段的结果互不截断，重叠由后续合并时处理：与正则结果重叠的结构化候选被丢弃
+        plan: 可选的检测方案，决定需要扫描的正则类型和结构化规则
+        返回 (正则类型匹配列表, 熵检测阶段的结构化候选列表)
+        """
+        # 兼容直接修改 sensitive_types 的情况，只有变化的模式才会重新编译
+        self._sync_patterns()
+        
+        labelled = []
+        for stage, included in (('regex', include_regex), ('structured', include_structured)):
+            if not included:
+                continue
+            combined_name, labels, separate = self._build_combined_pattern(stage, plan)
+            if combined_name and labels:
+                hits = Counter()
+                for match in self.pattern_registry.finditer(combined_name, text):
+                    stage, pattern_name, label = labels[match.lastgroup]
+                    hits[pattern_name] += 1
+                    labelled.append((stage, label, match))
+                # 将合并扫描的命中数计入各原始模式
+                for pattern_name, count in hits.items():
+                    self.pattern_registry.record_hits(pattern_name, count)
+            for stage, pattern_name, label in separate:
+                for match in self.pattern_registry.finditer(pattern_name, text):
+                    labelled.append((stage, label, match))
+        
+        regex_matches = []
+        structured_candidates = []
+        for stage, label, match in labelled:
+            matched_text = match.group()
+            if stage == 'regex':
+                regex_matches.append({
+                    'text': matched_text,
+                    'start': match.start(),
+                    'end': match.end(),
+                    'type': label
+                })
+            elif len(matched_text) >= self.min_token_len:
+                structured_candidates.append({
+                    'text': matched_text,
                     'start': match.start(),
                     'end': match.end(),
-                    'type': sensitive_type
+                    'entropy': self._char_entropy(matched_text),
+                    'type': label,
+                    'token_start': -1,
+                    'token_end': -1
                 })
         
         # 按起始位置排序
-        sensitive_matches.sort(key=lambda x: x['start'])
+        regex_matches.sort(key=lambda x: x['start'])
+        structured_candidates.sort(key=lambda x: x['start'])
         
-        return sensitive_matches
+        return regex_matches, structured_candidates
     
-    def detect_sensitive_info(self, text):
-        """综合检测文本中的敏感信息"""
+    def _regex_detect_sensitive(self, text):
+        """使用正则表达式检测敏感信息，所有启用的类型合并为一次扫描"""
+        regex_matches, _ = self._scan_patterns(text, include_structured=False)
+        return regex_matches
+    
+    def detect_sensitive_info(self, text, sensitive_types=None):
+        """综合检测文本中的敏感信息
+        sensitive_types: 可选，只检测并返回这些类型；输出类型全部未被需要的检测器和启发式分支不会运行
+        """
         if not text:
             return []
         
-        # 使用正则表达式检测
-        regex_matches = self._regex_detect_sensitive(text)
+        # 重复的文本直接使用缓存的检测结果；指纹在每次查找时按当前属性重新计算，
+        # 直接修改 sensitive_types 等属性后旧的缓存条目不会再命中
+        if self.detection_cache is not None:
+            self._update_detection_cache()
+        cache = self.detection_cache
+        plan = self._detection_plan(sensitive_types)
+        if cache is not None:
+            key = cache.key(text, self.config_fingerprint + plan.key)
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+            matches = self._detect_uncached(text, plan)
+            cache.put(key, matches)
+            return matches
+        
+        return self._detect_uncached(text, plan)
+    
+    def _detect_uncached(self, text, plan):
+        """不经缓存的检测，并记录各阶段的覆盖统计"""
+        # 长文本分片到多个进程并行检测
+        if self.shard_workers > 1 and len(text) > self.shard_size:
+            all_matches, stage_counts = self._detect_sharded(text, plan)
+        else:
+            all_matches, stage_counts = self._detect_single(text, plan)
+        self.cascade_stats.record(**stage_counts)
+        return all_matches
+    
+    def _detect_single(self, text, plan, owned=None):
+        """在当前进程中完成检测，返回 (检测结果, 各阶段覆盖的字符数)
+        owned: 可选的 (起点, 终点)，覆盖统计只计入该区间（分片检测时为分片自身负责的部分，不含重叠边距）
+        """
+        # 使用正则表达式检测：正则类型和熵检测阶段的结构化规则各自合并扫描一次
+        regex_matches, structured_candidates = self._scan_patterns(text, plan=plan)
+        
+        # 关键词索引由熵检测和通用类型细分共用
+        keyword_index = self.keyword_automaton.index(text)
+        
+        # 正则结果覆盖的区间
+        regex_spans = IntervalSet()
+        for match in regex_matches:
+            regex_spans.add(match['start'], match['end'])
         
-        # 使用信息熵检测候选
-        entropy_candidates = self._entropy_detect_candidates(text)
+        # 使用信息熵检测候选：级联模式下只枚举正则结果之间的空隙
+        covered = regex_spans if self.enable_detection_cascade else None
+        entropy_candidates = self._entropy_detect_candidates(text, structured_candidates, keyword_index, covered, plan)
         
         # 合并结果
         all_matches = regex_matches.copy()
         
         # 添加熵检测的结果，避免重复
-        regex_positions = set()
-        for match in regex_matches:
-            for pos in range(match['start'], match['end']):
-                regex_positions.add(pos)
-        
+        entropy_spans = IntervalSet()
         for candidate in entropy_candidates:
             # 检查是否与正则匹配重叠
-            overlap = False
-            for pos in range(candidate['start'], candidate['end']):
-                if pos in regex_positions:
-                    overlap = True
-                    break
-            
-            if not overlap:
+            if not regex_spans.overlaps(candidate['start'], candidate['end']):
                 # 尝试确定具体的敏感类型
                 if candidate['type'] == 'general':
-                    candidate_type = self._classify_general_sensitive(candidate['text'])
+                    candidate_type = self._classify_general_sensitive(candidate['text'], keyword_index, candidate['start'])
                 else:
                     candidate_type = candidate['type']
                 
@@ -618,24 +2301,131 @@ class EntropyEnhancedSensitiveModel:
                     'end': candidate['end'],
                     'type': candidate_type
                 })
+                entropy_spans.add(candidate['start'], candidate['end'])
+        
+        start, end = owned or (0, len(text))
+        regex_covered = regex_spans.covered(start, end)
+        if not self.enable_entropy_detection or not plan.entropy:
+            # 熵检测阶段没有运行
+            entropy_scanned = 0
+        elif covered is not None:
+            entropy_scanned = end - start - regex_covered
+        else:
+            entropy_scanned = end - start
+        stage_counts = {
+            'characters': end - start,
+            'regex_covered': regex_covered,
+            'entropy_scanned': entropy_scanned,
+            'entropy_covered': entropy_spans.covered(start, end)
+        }
+        
+        # 通用类型细分后仍可能得到未被需要的类型
+        if plan.types is not None:
+            all_matches = [match for match in all_matches if match['type'] in plan.types]
         
         # 按起始位置排序
         all_matches.sort(key=lambda x: x['start'])
         
-        return all_matches
+        return all_matches, stage_counts
     
-    def _classify_general_sensitive(self, text):
-        """对通用敏感信息进行更精确的分类"""
+    def _shard_bounds(self, text):
+        """在句末标点和换行处将文本切分为若干分片，返回各分片的 (起始, 结束) 位置"""
+        bounds = []
+        length = len(text)
+        start = 0
+        while start < length:
+            end = start + self.shard_size
+            if end >= length:
+                end = length
+            else:
+                # 在分片后半段内寻找最后一个句子边界，找不到时按长度硬切
+                boundary = max(text.rfind(char, start + self.shard_size // 2, end) for char in '。！？\n')
+                if boundary >= 0:
+                    end = boundary + 1
+            bounds.append((start, end))
+            start = end
+        return bounds
+    
+    def _detect_sharded(self, text, plan):
+        """分片并行检测：每个分片附带两侧重叠边距交给工作进程检测，合并时修正偏移
+        实体归属于起始位置所在的分片，跨分片边界的重复或重叠结果只保留一个
+        返回 (检测结果, 各阶段覆盖的字符数)，覆盖统计由各分片按自身负责的区间汇总
+        """
+        length = len(text)
+        bounds = self._shard_bounds(text)
+        offsets = []
+        shards = []
+        for start, end in bounds:
+            shard_start = max(0, start - self.shard_overlap)
+            offsets.append(shard_start)
+            shards.append(text[shard_start:min(length, end + self.shard_overlap)])
+        
+        pool = self._get_shard_pool()
+        owned = [(start - offset, end - offset) for (start, end), offset in zip(bounds, offsets)]
+        merged = []
+        stage_counts = Counter()
+        results = pool.map(_shard_detect, shards, itertools.repeat(plan.types), owned)
+        for (start, end), offset, (shard_matches, shard_counts) in zip(bounds, offsets, results):
+            stage_counts.update(shard_counts)
+            for match in shard_matches:
+                match['start'] += offset
+                match['end'] += offset
+                if start <= match['start'] < end:
+                    merged.append(match)
+        
+        # 按起始位置排序，丢弃与已保留结果重叠的跨边界结果
+        merged.sort(key=lambda x: x['start'])
+        accepted = IntervalSet()
+        all_matches = []
+        for match in merged:
+            if not accepted.overlaps(match['start'], match['end']):
+                accepted.add(match['start'], match['end'])
+                all_matches.append(match)
+        
+        return all_matches, dict(stage_counts)
+    
+    def _get_shard_pool(self):
+        """获取分片检测的常驻进程池，工作进程中的模型按当前检测配置构建一次
+        检测配置（包括直接修改的属性）或工作进程数变化时重建
+        """
+        key = (self._detection_fingerprint(), self.shard_workers)
+        if self.shard_pool is not None and self.shard_pool_key != key:
+            self.shutdown_shard_pool()
+        if self.shard_pool is None:
+            self.shard_pool = ProcessPoolExecutor(
+                max_workers=self.shard_workers,
+                initializer=_init_batch_worker,
+                initargs=(self.detection_config(),)
+            )
+            self.shard_pool_key = key
+        return self.shard_pool
+    
+    def shutdown_shard_pool(self):
+        """关闭分片检测的进程池"""
+        if self.shard_pool is not None:
+            self.shard_pool.shutdown()
+            self.shard_pool = None
+            self.shard_pool_key = None
+    
+    def _classify_general_sensitive(self, text, keyword_index=None, start=0):
+        """对通用敏感信息进行更精确的分类
+        keyword_index/start: 文档级关键词索引及片段起始位置，未提供时只扫描片段本身
+        """
+        if keyword_index is None:
+            keyword_index = self.keyword_automaton.index(text)
+            start = 0
+        end = start + len(text)
+        
         # 简单的规则分类
-        if len(text) >= 2 and any(title in text for title in ('经理', '总监', '总裁', '董事长', '总经理', '副总经理', '部门经理', '主管', '专员', '工程师', '分析师', '顾问', '代表')):
+        if len(text) >= 2 and keyword_index.contains('general_position', start, end):
             return 'position'
-        elif len(text) >= 2 and any(dept in text for dept in ('部门', '部', '处', '科', '组', '室')):
+        elif len(text) >= 2 and keyword_index.contains('general_department', start, end):
             return 'department'
-        elif len(text) >= 4 and any(addr in text for addr in ('省', '市', '区', '县', '街道', '路', '号')):
+        elif len(text) >= 4 and keyword_index.contains('address', start, end):
             return 'address'
-        elif re.search(r'\d+', text) and (re.search(r'[a-zA-Z]', text) or any(char in text for char in '-_')):
+        elif self.pattern_registry.search('heuristic.digits', text) and (self.pattern_registry.search('heuristic.latin', text) or any(char in text for char in '-_')):
             return 'structured_data'
-        elif re.search(r'[0-9]+', text) and re.search(r'[a-zA-Z\u4e00-\u9fa5]+', text):
+        elif self.pattern_registry.search('heuristic.ascii_digits', text) and self.pattern_registry.search('heuristic.word', text):
             return 'mixed_content'
         elif len(text) >= 4 and all('\u4e00' <= char <= '\u9fff' for char in text):
             return 'chinese_phrase'
@@ -699,7 +2489,7 @@ class EntropyEnhancedSensitiveModel:
         # 根据不同类型进行泛化处理
         if sensitive_type == 'amount':
             # 金额泛化：保留数量级，四舍五入到最近的百位或千位
-            match = re.search(r'\d+(?:,\d{3})*(?:\.\d{1,2})?', sensitive_text)
+            match = self.pattern_registry.search('generalize.amount', sensitive_text)
             if match:
                 amount_str = match.group().replace(',', '')
                 try:
@@ -714,7 +2504,7 @@ class EntropyEnhancedSensitiveModel:
                 generalized = '[金额信息]'
         elif sensitive_type == 'age':
             # 年龄泛化：转换为年龄段
-            match = re.search(r'\d+', sensitive_text)
+            match = self.pattern_registry.search('generalize.number', sensitive_text)
             if match:
                 age = int(match.group())
                 if age < 18:
@@ -744,86 +2534,182 @@ class EntropyEnhancedSensitiveModel:
         if not text:
             return text, {}
         
-        # 检测敏感信息
-        detected_sensitive = self.detect_sensitive_info(text)
+        result_text, mapping = self._desensitize_text(text, sensitive_types, strategy)
         
-        # 如果指定了敏感类型，过滤结果
-        if sensitive_types:
-            detected_sensitive = [info for info in detected_sensitive if info['type'] in sensitive_types]
+        # 创建会话ID并保存映射
+        session_id = self._create_session(mapping)
         
-        # 按照结束位置倒序排序，避免替换时位置偏移
-        detected_sensitive.sort(key=lambda x: x['end'], reverse=True)
+        return result_text, mapping, session_id
+    
+    def _desensitize_text(self, text, sensitive_types=None, strategy='placeholder'):
+        """检测并替换敏感信息，返回 (脱敏后文本, 映射关系)，不创建会话"""
+        # 检测敏感信息：指定了敏感类型时只运行这些类型所需的检测器
+        detected_sensitive = self.detect_sensitive_info(text, sensitive_types)
         
         # 执行脱敏替换
-        result_text = text
+        return self._apply_replacements(text, detected_sensitive, strategy)
+    
+    def desensitize_stream(self, fileobj, sensitive_types=None, strategy='placeholder'):
+        """流式脱敏：按块读取文本文件对象，逐块产出脱敏后的文本，整个文件共用一个会话映射
+        返回 (脱敏文本块迭代器, 映射关系, 会话ID)；映射关系随迭代逐步填充
+        """
         mapping = {}
+        session_id = self._create_session(mapping)
+        return self._desensitize_chunks(fileobj, sensitive_types, strategy, mapping, session_id), mapping, session_id
+    
+    def _desensitize_chunks(self, fileobj, sensitive_types, strategy, mapping, session_id):
+        """按窗口检测并替换：窗口末尾的重叠部分留到下一个窗口，带着后续文本重新检测"""
         counter = defaultdict(int)
-        
-        for sensitive_info in detected_sensitive:
-            sensitive_type = sensitive_info['type']
-            counter[sensitive_type] += 1
+        overlap = max(self.stream_overlap, self.max_token_len * 2)
+        chunk_size = max(self.stream_chunk_size, overlap + 1)
+        carry = ''
+        
+        while True:
+            chunk = fileobj.read(chunk_size)
+            at_eof = not chunk
+            buffer = carry + chunk
+            if not buffer:
+                break
             
-            # 获取脱敏策略函数
-            desensitize_func = self.desensitization_strategies.get(strategy, self._placeholder_desensitize)
+            detected_sensitive = self.detect_sensitive_info(buffer, sensitive_types)
             
-            # 执行脱敏
-            placeholder = desensitize_func(result_text, sensitive_info, mapping, counter[sensitive_type])
+            if at_eof:
+                cut = len(buffer)
+            else:
+                # 优先在重叠窗口之前的最后一个换行处截断，跨越截断点的实体整体留到下一个窗口
+                cut = len(buffer) - overlap
+                newline = buffer.rfind('\n', 0, cut)
+                if newline >= 0:
+                    cut = newline + 1
+                for info in reversed(detected_sensitive):
+                    if info['start'] < cut < info['end']:
+                        cut = info['start']
+            
+            if cut > 0:
+                emitted = [info for info in detected_sensitive if info['end'] <= cut]
+                desensitized_text, _ = self._apply_replacements(buffer[:cut], emitted, strategy, mapping, counter)
+                # 持久化会话存储中同步保存增长后的映射
+                self.sessions.update(session_id, mapping)
+                yield desensitized_text
             
-            # 替换文本中的敏感信息
+            carry = buffer[cut:]
+            if at_eof:
+                break
+        
+        # 映射关系不再变化，按配置转换为紧凑格式保存
+        if self.compact_session_mappings:
+            self.sessions.update(session_id, self._session_mapping(mapping))
+    
+    def _apply_replacements(self, text, detected_sensitive, strategy, mapping=None, counter=None):
+        """一次正向拼接完成所有替换，返回 (脱敏后文本, 映射关系)
+        占位符编号仍按结束位置倒序分配，与逐个切片替换时的编号一致；
+        传入 mapping 和 counter 时在其上继续累积，用于流式脱敏的多个窗口
+        """
+        # 按照结束位置倒序生成占位符，保持原有的编号顺序
+        ordered = sorted(detected_sensitive, key=lambda x: x['end'], reverse=True)
+        
+        if mapping is None:
+            mapping = {}
+        if counter is None:
+            counter = defaultdict(int)
+        replacements = []
+        # 已接受片段中最靠左的起始位置；按结束位置倒序处理时，结束位置超过它的片段必然重叠
+        leftmost_start = len(text)
+        
+        # 获取脱敏策略函数
+        desensitize_func = self.desensitization_strategies.get(strategy, self._placeholder_desensitize)
+        
+        for sensitive_info in ordered:
             start = sensitive_info['start']
             end = sensitive_info['end']
-            result_text = result_text[:start] + placeholder + result_text[end:]
-        
-        # 创建会话ID并保存映射
-        session_id = self._create_session(mapping)
-        
-        return result_text, mapping, session_id
+            # 与已替换区间重叠的片段无法同时替换，跳过
+            if end > leftmost_start:
+                continue
+            leftmost_start = start
+            
+            sensitive_type = sensitive_info['type']
+            counter[sensitive_type] += 1
+            
+            # 执行脱敏
+            placeholder = desensitize_func(text, sensitive_info, mapping, counter[sensitive_type])
+            replacements.append((start, end, placeholder))
+        
+        # 从左到右收集未替换的原文片段和占位符，最后只拼接一次
+        segments = []
+        cursor = 0
+        for start, end, placeholder in reversed(replacements):
+            segments.append(text[cursor:start])
+            segments.append(placeholder)
+            cursor = end
+        segments.append(text[cursor:])
+        
+        return ''.join(segments), mapping
     
-    def restore(self, text, mapping, session_id=None):
-        """还原脱敏后的文本"""
-        if not text or not mapping:
+    def restore(self, text, mapping=None, session_id=None):
+        """还原脱敏后的文本；只提供会话ID时使用会话存储上缓存的还原引擎"""
+        if not text:
             return text
         
+        engine = self._restore_engine(mapping, session_id)
+        return text if engine is None else engine.restore(text)
+    
+    def restore_stream(self, chunks, mapping=None, session_id=None):
+        """流式还原大模型逐块输出的文本，逐块产出还原后的文本"""
+        engine = self._restore_engine(mapping, session_id)
+        if engine is None:
+            return (chunk for chunk in chunks if chunk)
+        return engine.restore_stream(chunks)
+    
+    def _restore_engine(self, mapping=None, session_id=None):
+        """获取还原引擎，没有可用的映射时返回None
+        未提供映射时直接使用会话存储上缓存的引擎，无需先取出映射（持久化存储每次取出都要反序列化出新对象）；
+        提供的映射即会话映射时同样复用缓存的引擎，否则按（合并后的）映射新建
+        """
+        if mapping is None:
+            return self.sessions.restore_engine(session_id) if session_id else None
+        if not mapping:
+            return None
+        
         # 如果提供了会话ID，尝试从会话中获取映射
-        if session_id and session_id in self.sessions:
-            session_mapping = self.sessions[session_id]
+        session_mapping = self.sessions.get(session_id) if session_id else None
+        if session_mapping is not None:
+            if mapping is session_mapping:
+                return self.sessions.restore_engine(session_id)
             # 合并映射
             mapping = {**mapping, **session_mapping}
         
-        # 执行还原替换
-        result_text = text
-        
-        # 按照替换文本长度倒序排序，避免替换时位置偏移
-        sorted_items = sorted(mapping.items(), key=lambda x: len(x[0]), reverse=True)
-        
-        for placeholder, original_text in sorted_items:
-            # 处理假名化和数据泛化的特殊映射
-            if isinstance(original_text, tuple):
-                pseudonym_text, actual_original = original_text
-                result_text = result_text.replace(pseudonym_text, actual_original)
-            else:
-                result_text = result_text.replace(placeholder, original_text)
-        
-        return result_text
+        # 执行还原替换：所有占位符编译为一个正则，一次扫描完成
+        return RestoreEngine(mapping)
     
     def _create_session(self, mapping):
         """创建一个新的会话并保存映射"""
-        self.session_counter += 1
-        session_id = f"session_{int(time.time())}_{self.session_counter}"
-        self.sessions[session_id] = mapping
-        
-        # 限制会话数量，避免内存泄漏
-        if len(self.sessions) > 1000:
-            # 删除最早的会话
-            oldest_session = min(self.sessions.keys())
-            del self.sessions[oldest_session]
-        
-        return session_id
+        return self.sessions.create(self._session_mapping(mapping))
+    
+    def _session_mapping(self, mapping):
+        """按配置将映射关系转换为会话中保存的形式"""
+        if self.compact_session_mappings and not isinstance(mapping, CompactMapping):
+            return CompactMapping(mapping)
+        return mapping
     
     def get_session_mapping(self, session_id):
         """获取指定会话的映射关系"""
         return self.sessions.get(session_id, {})
 
+class MockAsyncLLMClient:
+    """异步大模型客户端的本地模拟实现
+    真实的大模型客户端只需提供同样的 async complete(prompt) 方法，即可替换到工作流中
+    """
+    
+    def __init__(self, respond, latency=0.0):
+        # respond: 根据提示词生成模拟回答的函数；latency: 模拟的网络往返耗时（秒）
+        self.respond = respond
+        self.latency = latency
+    
+    async def complete(self, prompt):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.respond(prompt)
+
 class EntropyEnhancedHaSWorkflow:
     def __init__(self):
         # 初始化端侧小模型
@@ -834,12 +2720,43 @@ class EntropyEnhancedHaSWorkflow:
             'sensitive_types': ['name', 'company', 'position', 'phone', 'id', 'email'],
             'desensitization_strategy': 'placeholder',
             'enable_entropy_detection': True,
-            'enable_position_entropy': True
+            'enable_position_entropy': True,
+            # 异步工作流：同时处理的最大请求数，以及各阶段的超时时间（秒，None表示不限）
+            'max_concurrency': 100,
+            'stage_timeouts': {'desensitization': 30, 'llm': 120, 'restore': 30}
         }
         
-        # 会话管理
-        self.current_session_id = None
-        self.current_mapping = {}
+        # 异步工作流使用的大模型客户端，默认为本地模拟
+        self.llm_client = MockAsyncLLMClient(self._mock_llm_processing)
+        # 运行CPU密集的检测和还原的执行器，None表示事件循环的默认线程池
+        self.executor = None
+        # 事件循环 -> 并发限制信号量
+        self.async_semaphores = {}
+        
+        # 会话管理：当前会话按线程区分，线程池服务共用一个工作流时各请求互不干扰
+        self.request_context = threading.local()
+        
+        # 批量脱敏的常驻进程池，以及构建它时的 (检测配置指纹, 工作进程数)
+        self.batch_pool = None
+        self.batch_pool_key = None
+    
+    @property
+    def current_session_id(self):
+        """当前线程最近一次脱敏的会话ID"""
+        return getattr(self.request_context, 'session_id', None)
+    
+    @current_session_id.setter
+    def current_session_id(self, session_id):
+        self.request_context.session_id = session_id
+    
+    @property
+    def current_mapping(self):
+        """当前线程最近一次脱敏的映射关系"""
+        return getattr(self.request_context, 'mapping', {})
+    
+    @current_mapping.setter
+    def current_mapping(self, mapping):
+        self.request_context.mapping = mapping
     
     def configure(self, **kwargs):
         """配置工作流参数"""
@@ -849,6 +2766,10 @@ class EntropyEnhancedHaSWorkflow:
         
         # 配置端侧模型
         self.endside_model.configure(**kwargs)
+        
+        # 并发上限变化后重新创建信号量
+        if 'max_concurrency' in kwargs:
+            self.async_semaphores.clear()
     
     def run_desensitization(self, user_input):
         """执行脱敏流程"""
@@ -873,22 +2794,104 @@ class EntropyEnhancedHaSWorkflow:
             'num_sensitive': num_sensitive
         }
     
+    def run_desensitization_stream(self, fileobj):
+        """执行流式脱敏流程：按块读取文件对象，逐块产出脱敏后的文本"""
+        desensitized_chunks, mapping, session_id = self.endside_model.desensitize_stream(
+            fileobj,
+            sensitive_types=self.config['sensitive_types'],
+            strategy=self.config['desensitization_strategy']
+        )
+        
+        # 保存会话信息；映射关系在迭代脱敏文本块的过程中逐步填充
+        self.current_session_id = session_id
+        self.current_mapping = mapping
+        
+        return {
+            'desensitized_chunks': desensitized_chunks,
+            'session_id': session_id,
+            'mapping': mapping
+        }
+    
+    def run_desensitization_batch(self, texts, workers=None, chunksize=1):
+        """并行批量脱敏：在进程池中处理多段文本，按输入顺序返回结果
+        每段文本的映射关系合并到本进程的会话中，返回的会话ID可直接用于还原
+        workers: 工作进程数，默认为CPU核数；为1时在当前进程中顺序处理
+        chunksize: 每次分发给工作进程的文本数量
+        """
+        sensitive_types = self.config['sensitive_types']
+        strategy = self.config['desensitization_strategy']
+        tasks = [(text, sensitive_types, strategy) for text in texts]
+        
+        workers = workers or os.cpu_count() or 1
+        if workers <= 1 or len(tasks) <= 1:
+            outputs = [_batch_desensitize(task, self.endside_model) for task in tasks]
+        else:
+            pool = self._get_batch_pool(workers)
+            outputs = pool.map(_batch_desensitize, tasks, chunksize=chunksize)
+        
+        results = []
+        for desensitized_text, mapping in outputs:
+            session_id = self.endside_model._create_session(mapping)
+            results.append({
+                'desensitized_text': desensitized_text,
+                'session_id': session_id,
+                'mapping': mapping,
+                'num_sensitive': len(mapping)
+            })
+        
+        return results
+    
+    def _get_batch_pool(self, workers):
+        """获取常驻进程池，工作进程中的模型按端侧模型当前的检测配置构建
+        检测配置（包括直接修改的属性）或工作进程数变化时重建
+        """
+        key = (self.endside_model._detection_fingerprint(), workers)
+        if self.batch_pool is None or self.batch_pool_key != key:
+            self.shutdown_batch_pool()
+            self.batch_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_batch_worker,
+                initargs=(self.endside_model.detection_config(),)
+            )
+            self.batch_pool_key = key
+        return self.batch_pool
+    
+    def shutdown_batch_pool(self):
+        """关闭批量脱敏的进程池"""
+        if self.batch_pool is not None:
+            self.batch_pool.shutdown()
+            self.batch_pool = None
+            self.batch_pool_key = None
+    
     def run_restore(self, llm_output, session_id=None, mapping=None):
         """执行还原流程"""
-        # 使用提供的会话ID或映射，否则使用当前会话
-        if session_id:
-            mapping = self.endside_model.get_session_mapping(session_id)
+        # 只提供会话ID时由会话存储直接提供缓存的还原引擎，不必先取出映射；否则使用提供的映射或当前会话
+        restore_session_id = session_id
+        if session_id and not mapping:
+            mapping = None
         elif not mapping:
             mapping = self.current_mapping
         
+        # 使用当前会话的映射时同样传入会话ID，以复用会话上缓存的还原引擎
+        if not restore_session_id and mapping is self.current_mapping:
+            restore_session_id = self.current_session_id
+        
         # 调用端侧模型进行还原
-        restored_text = self.endside_model.restore(llm_output, mapping)
+        restored_text = self.endside_model.restore(llm_output, mapping, restore_session_id)
         
         return {
             'restored_text': restored_text,
             'session_id': session_id or self.current_session_id
         }
     
+    def restore_stream(self, session_id, chunk_iter):
+        """流式还原：大模型逐块输出时，每到达一块即产出已可确定的还原文本"""
+        session_id = session_id or self.current_session_id
+        # 按会话还原时直接使用会话存储上缓存的还原引擎
+        mapping = None if session_id else self.current_mapping
+        
+        return self.endside_model.restore_stream(chunk_iter, mapping, session_id)
+    
     def run_complete_workflow(self, user_input):
         """运行完整的脱敏-处理-还原工作流"""
         # 记录开始时间
@@ -920,18 +2923,161 @@ class EntropyEnhancedHaSWorkflow:
             'processing_time': processing_time
         }
     
+    def run_complete_workflow_stream(self, fileobj):
+        """流式运行完整工作流，适用于大文件：内存占用与文件大小无关
+        返回的 'sections' 依次产出 (阶段名, 文本块迭代器)，每个阶段的文本块需在取下一个阶段前迭代完毕；
+        阶段之间通过临时文件衔接，文件对象需可回退读取位置
+        """
+        start = fileobj.tell()
+        desensitization_result = self.run_desensitization_stream(fileobj)
+        
+        return {
+            'sections': self._complete_workflow_sections(fileobj, start, desensitization_result),
+            'session_id': desensitization_result['session_id'],
+            'mapping': desensitization_result['mapping']
+        }
+    
+    def _complete_workflow_sections(self, fileobj, start, desensitization_result):
+        """依次产出原始文本、脱敏后文本、模拟大模型输出和还原后文本的文本块迭代器"""
+        chunk_size = self.endside_model.stream_chunk_size
+        
+        # 1. 原始文本：直接分块读取，读完后回到起始位置供脱敏使用
+        yield 'original_text', iter(lambda: fileobj.read(chunk_size), '')
+        fileobj.seek(start)
+        
+        with tempfile.TemporaryFile('w+', encoding='utf-8') as desensitized_file, \
+                tempfile.TemporaryFile('w+', encoding='utf-8') as llm_file:
+            # 2. 脱敏处理
+            yield 'desensitized_text', self._tee_chunks(desensitization_result['desensitized_chunks'], desensitized_file)
+            desensitized_file.seek(0)
+            
+            # 3. 模拟大模型处理
+            llm_chunks = self._mock_llm_stream(iter(lambda: desensitized_file.read(chunk_size), ''))
+            yield 'llm_output', self._tee_chunks(llm_chunks, llm_file)
+            llm_file.seek(0)
+            
+            # 4. 还原处理
+            yield 'restored_text', self.restore_stream(desensitization_result['session_id'],
+                                                      iter(lambda: llm_file.read(chunk_size), ''))
+    
+    @staticmethod
+    def _tee_chunks(chunks, fileobj):
+        """产出文本块的同时写入临时文件，供下一个阶段再次读取"""
+        for chunk in chunks:
+            fileobj.write(chunk)
+            yield chunk
+    
+    async def arun_complete_workflow(self, user_input, llm_client=None):
+        """异步运行完整的脱敏-处理-还原工作流
+        检测和还原在执行器中运行，不阻塞事件循环；等待大模型回答期间可同时处理其他请求。
+        不修改 current_session_id / current_mapping，多个请求之间互不影响
+        """
+        # 空输入没有需要脱敏和处理的内容，直接返回空结果
+        if not user_input:
+            return {
+                'original_text': user_input,
+                'desensitized_text': user_input,
+                'llm_output': '',
+                'restored_text': '',
+                'session_id': None,
+                'num_sensitive': 0,
+                'processing_time': 0.0
+            }
+        
+        loop = asyncio.get_running_loop()
+        llm_client = llm_client or self.llm_client
+        
+        async with self._async_semaphore(loop):
+            # 记录开始时间
+            start_time = time.time()
+            
+            # 1. 脱敏处理
+            desensitized_text, mapping, session_id = await self._await_stage('desensitization', loop.run_in_executor(
+                self.executor, self.endside_model.desensitize,
+                user_input, self.config['sensitive_types'], self.config['desensitization_strategy']
+            ))
+            
+            # 2. 大模型处理
+            llm_output = await self._await_stage('llm', llm_client.complete(desensitized_text))
+            
+            # 3. 还原处理
+            restored_text = await self._await_stage('restore', loop.run_in_executor(
+                self.executor, self.endside_model.restore, llm_output, mapping, session_id
+            ))
+            
+            # 计算处理时间
+            processing_time = time.time() - start_time
+        
+        return {
+            'original_text': user_input,
+            'desensitized_text': desensitized_text,
+            'llm_output': llm_output,
+            'restored_text': restored_text,
+            'session_id': session_id,
+            'num_sensitive': len(mapping),
+            'processing_time': processing_time
+        }
+    
+    def _async_semaphore(self, loop):
+        """获取当前事件循环上的并发限制信号量"""
+        semaphore = self.async_semaphores.get(loop)
+        if semaphore is None:
+            # 清理已关闭事件循环上的信号量
+            for closed_loop in [l for l in self.async_semaphores if l.is_closed()]:
+                del self.async_semaphores[closed_loop]
+            semaphore = asyncio.Semaphore(self.config['max_concurrency'])
+            self.async_semaphores[loop] = semaphore
+        return semaphore
+    
+    async def _await_stage(self, stage, awaitable):
+        """按阶段超时等待，超时时指明是哪个阶段"""
+        try:
+            return await asyncio.wait_for(awaitable, self.config['stage_timeouts'].get(stage))
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError(f"工作流阶段超时: {stage}")
+    
     def _mock_llm_processing(self, input_text):
         """模拟大模型的处理过程"""
         # 简单的模拟处理，实际应用中应替换为真实的大模型调用
         # 这里只是为了演示，实际上应该调用真正的大模型API
+        return ''.join(self._mock_llm_stream([input_text]))
+    
+    def _mock_llm_stream(self, chunks):
+        """模拟大模型的流式输出：在输入文本块前后加上随机选择的模拟响应"""
         mock_responses = [
-            f"处理结果：{input_text}\n这是生成的内容。",
-            f"根据您提供的信息：{input_text}\n我分析得出以下结论。",
-            f"关于{input_text}的问题，我的回答如下。"
+            ("处理结果：", "\n这是生成的内容。"),
+            ("根据您提供的信息：", "\n我分析得出以下结论。"),
+            ("关于", "的问题，我的回答如下。")
         ]
         
         # 随机选择一个模拟响应
-        return random.choice(mock_responses)
+        prefix, suffix = random.choice(mock_responses)
+        yield prefix
+        yield from chunks
+        yield suffix
+
+# 批量脱敏和分片检测工作进程中常驻的端侧模型，由进程池初始化函数构建
+_batch_worker_model = None
+
+def _init_batch_worker(model_config):
+    """进程池初始化：每个工作进程只构建一次端侧模型，之后的任务复用"""
+    global _batch_worker_model
+    _batch_worker_model = EntropyEnhancedSensitiveModel()
+    _batch_worker_model.configure(**model_config)
+    # 工作进程内不再嵌套分片并行
+    _batch_worker_model.shard_workers = 0
+
+def _shard_detect(text, sensitive_types=None, owned=None):
+    """分片检测任务：返回分片内的检测结果（偏移相对于分片起点）及分片负责区间内各阶段覆盖的字符数"""
+    model = _batch_worker_model
+    return model._detect_single(text, model._detection_plan(sensitive_types), owned)
+
+def _batch_desensitize(task, model=None):
+    """批量脱敏任务：返回 (脱敏后文本, 映射关系)，会话由主进程统一创建"""
+    text, sensitive_types, strategy = task
+    if not text:
+        return text, {}
+    return (model or _batch_worker_model)._desensitize_text(text, sensitive_types, strategy)
 
 # 用户交互演示函数
 def user_interaction_demo():
@@ -1005,9 +3151,6 @@ def user_interaction_demo():
             file_path = input("请输入文件路径: ")
             
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    file_content = f.read()
-                
                 print("请选择处理模式：")
                 print("1. 脱敏处理（输出脱敏后文件）")
                 print("2. 还原处理（输入脱敏文件的大模型回答，输出还原后文件）")
@@ -1016,18 +3159,19 @@ def user_interaction_demo():
                 mode_choice = input("请输入您的选择 (1-3): ")
                 
                 if mode_choice == '1':
-                    # 脱敏处理
-                    result = workflow.run_desensitization(file_content)
-                    
-                    # 保存脱敏结果到文件
+                    # 脱敏处理：逐块读取、逐块写出
                     output_path = file_path.replace('.', '_desensitized.')
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        f.write(f"脱敏后文本：\n{result['desensitized_text']}\n\n")
-                        f.write(f"识别到的敏感信息数量：{result['num_sensitive']}\n")
+                    with open(file_path, 'r', encoding='utf-8') as src, open(output_path, 'w', encoding='utf-8') as f:
+                        result = workflow.run_desensitization_stream(src)
+                        f.write("脱敏后文本：\n")
+                        for chunk in result['desensitized_chunks']:
+                            f.write(chunk)
+                        f.write("\n\n")
+                        f.write(f"识别到的敏感信息数量：{len(result['mapping'])}\n")
                         f.write(f"会话ID：{result['session_id']}\n")
                     
                     print(f"\n文件脱敏完成，结果已保存到：{output_path}")
-                    print(f"识别到的敏感信息数量：{result['num_sensitive']}")
+                    print(f"识别到的敏感信息数量：{len(result['mapping'])}")
                     print(f"会话ID：{result['session_id']}")
                     
                 elif mode_choice == '2':
@@ -1036,37 +3180,42 @@ def user_interaction_demo():
                     llm_output_path = input("请输入包含大模型回答的文件路径: ")
                     
                     try:
-                        with open(llm_output_path, 'r', encoding='utf-8') as f:
-                            llm_output = f.read()
-                        
-                        result = workflow.run_restore(llm_output, session_id)
-                        
-                        # 保存还原结果到文件
+                        # 逐块读取大模型回答并流式还原，保存还原结果到文件
                         output_path = llm_output_path.replace('.', '_restored.')
-                        with open(output_path, 'w', encoding='utf-8') as f:
-                            f.write(f"还原后文本：\n{result['restored_text']}\n")
+                        chunk_size = workflow.endside_model.stream_chunk_size
+                        with open(llm_output_path, 'r', encoding='utf-8') as src, open(output_path, 'w', encoding='utf-8') as f:
+                            f.write("还原后文本：\n")
+                            for chunk in workflow.restore_stream(session_id, iter(lambda: src.read(chunk_size), '')):
+                                f.write(chunk)
+                            f.write("\n")
                         
                         print(f"\n文件还原完成，结果已保存到：{output_path}")
                     except Exception as e:
                         print(f"读取大模型回答文件失败：{str(e)}")
                     
                 elif mode_choice == '3':
-                    # 完整流程演示
-                    result = workflow.run_complete_workflow(file_content)
-                    
-                    # 保存结果到文件
+                    # 完整流程演示：各阶段逐块写入结果文件
+                    start_time = time.time()
+                    section_titles = {
+                        'original_text': "原始文本：",
+                        'desensitized_text': "脱敏后：",
+                        'llm_output': "模拟大模型输出：",
+                        'restored_text': "还原后："
+                    }
                     output_path = file_path.replace('.', '_complete_workflow.')
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        f.write(f"原始文本：\n{result['original_text']}\n\n")
-                        f.write(f"脱敏后：\n{result['desensitized_text']}\n\n")
-                        f.write(f"模拟大模型输出：\n{result['llm_output']}\n\n")
-                        f.write(f"还原后：\n{result['restored_text']}\n\n")
-                        f.write(f"识别到的敏感信息数量：{result['num_sensitive']}\n")
+                    with open(file_path, 'r', encoding='utf-8') as src, open(output_path, 'w', encoding='utf-8') as f:
+                        result = workflow.run_complete_workflow_stream(src)
+                        for section, chunks in result['sections']:
+                            f.write(f"{section_titles[section]}\n")
+                            for chunk in chunks:
+                                f.write(chunk)
+                            f.write("\n\n")
+                        f.write(f"识别到的敏感信息数量：{len(result['mapping'])}\n")
                         f.write(f"会话ID：{result['session_id']}\n")
-                        f.write(f"处理时间：{result['processing_time']:.4f}秒\n")
+                        f.write(f"处理时间：{time.time() - start_time:.4f}秒\n")
                     
                     print(f"\n文件处理完成，结果已保存到：{output_path}")
-                    print(f"识别到的敏感信息数量：{result['num_sensitive']}")
+                    print(f"识别到的敏感信息数量：{len(result['mapping'])}")
                     print(f"会话ID：{result['session_id']}")
                     
                 else:
@@ -1151,9 +3300,147 @@ def batch_test():
     print(f"总处理时间：{total_time:.4f}秒")
     print("=== 批量测试结束 ===")
 
+def batch_benchmark(num_texts=400, max_workers=None):
+    """批量脱敏吞吐量基准：对比不同工作进程数下每秒处理的文本数"""
+    print("=== 批量脱敏吞吐量基准 ===")
+    
+    texts = [
+        f"员工{i}号张三的身份证号码是110101199001011234，联系电话是1380013{i:04d}，"
+        f"邮箱是user{i}@example.com，就职于腾讯科技(深圳)有限公司，担任产品经理"
+        for i in range(num_texts)
+    ]
+    
+    max_workers = max_workers or os.cpu_count() or 1
+    worker_counts = sorted({1, *[2 ** k for k in range(1, max_workers.bit_length()) if 2 ** k < max_workers], max_workers})
+    
+    baseline = None
+    for workers in worker_counts:
+        workflow = EntropyEnhancedHaSWorkflow()
+        # 预热进程池，使计时不包含工作进程启动和模型构建
+        workflow.run_desensitization_batch(texts[:workers * 2], workers=workers)
+        
+        start_time = time.time()
+        workflow.run_desensitization_batch(texts, workers=workers, chunksize=8)
+        elapsed = time.time() - start_time
+        workflow.shutdown_batch_pool()
+        
+        throughput = num_texts / elapsed
+        baseline = baseline or throughput
+        print(f"工作进程数：{workers}，吞吐量：{throughput:.1f}条/秒，加速比：{throughput / baseline:.2f}x")
+    
+    print("=== 基准测试结束 ===")
+
+def session_store_benchmark(num_threads=8, operations=20000):
+    """会话存储争用基准：多线程同时创建、读取会话和获取还原引擎，对比单锁与分条加锁的吞吐量"""
+    print("=== 会话存储争用基准 ===")
+    
+    for stripes in (1, 16):
+        store = SessionStore(max_sessions=operations, stripes=stripes)
+        per_thread = operations // num_threads
+        
+        def worker():
+            for i in range(per_thread):
+                session_id = store.create({f'<phone_{i}>': '13800138000'})
+                store.get(session_id)
+                store.restore_engine(session_id)
+        
+        threads = [threading.Thread(target=worker) for _ in range(num_threads)]
+        start_time = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start_time
+        
+        print(f"分条数：{stripes}，线程数：{num_threads}，吞吐量：{per_thread * num_threads / elapsed:.0f}次/秒，会话数：{len(store)}")
+    
+    print("=== 基准测试结束 ===")
+
+def candidate_scoring_benchmark(path='test_long_text.txt'):
+    """候选评分基准：对比单遍增量评分流水线与逐片段拼接文本、查找位置并从头统计熵值的参照实现"""
+    print("=== 候选评分基准 ===")
+    model = EntropyEnhancedSensitiveModel()
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    
+    # 参照实现：每个片段拼接文本、查找位置并从头统计熵值后分类，多token片段评估两次
+    tokens = model._tokenize_simple(text)
+    window = model.max_token_len // 2
+    start_time = time.time()
+    for i in range(len(tokens)):
+        for j in range(i, min(i + window, len(tokens))):
+            candidate_text = ''.join(tokens[i:j+1])
+            for _ in range(2 if j > i else 1):
+                start = text.find(candidate_text)
+                model.score_candidate(text, start, start + len(candidate_text))
+    reference_time = time.time() - start_time
+    
+    # 单遍评分流水线（包含启发式分类）
+    start_time = time.time()
+    candidates = model._entropy_detect_candidates(text)
+    pipeline_time = time.time() - start_time
+    
+    print(f"参照实现耗时：{reference_time:.4f}秒，单遍评分耗时：{pipeline_time:.4f}秒，"
+          f"加速比：{reference_time / pipeline_time:.2f}，候选数：{len(candidates)}")
+    print("=== 基准测试结束 ===")
+
+def entropy_backend_benchmark(repeat=3):
+    """熵计算后端基准：对比纯Python逐token增量计算与NumPy批量计算在不同文本长度下的候选检测耗时"""
+    print("=== 熵计算后端基准 ===")
+    if np is None:
+        print("未安装NumPy，只能使用纯Python后端")
+        return
+    
+    model = EntropyEnhancedSensitiveModel()
+    sample = "客户张三的账号是Zx9Kq2LmP0，联系电话13800138000，所属部门为市场部。" * 400
+    for length in (100, 1000, 10000):
+        text = sample[:length]
+        timings = {}
+        for backend in ('python', 'numpy'):
+            model.configure(entropy_backend=backend)
+            start_time = time.time()
+            for _ in range(repeat):
+                candidates = model._entropy_detect_candidates(text)
+            timings[backend] = (time.time() - start_time) / repeat
+        print(f"文本长度：{length}，纯Python：{timings['python'] * 1000:.1f}毫秒，NumPy：{timings['numpy'] * 1000:.1f}毫秒，"
+              f"加速比：{timings['python'] / timings['numpy']:.2f}，候选数：{len(candidates)}")
+    
+    print("=== 基准测试结束 ===")
+
+def replacement_benchmark(entity_counts=(4000, 16000), repeat=3):
+    """脱敏替换扩展性基准：敏感信息数量成倍增加时替换阶段的耗时，线性实现的耗时比接近数量比"""
+    print("=== 脱敏替换扩展性基准 ===")
+    model = EntropyEnhancedSensitiveModel()
+    segment = "客户电话13800138000，"
+    
+    timings = []
+    for entity_count in entity_counts:
+        text = segment * entity_count
+        detected = [{'text': '13800138000', 'start': i * len(segment) + 4,
+                     'end': i * len(segment) + 15, 'type': 'phone'} for i in range(entity_count)]
+        best = float('inf')
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            model._apply_replacements(text, detected, 'placeholder')
+            best = min(best, time.perf_counter() - start_time)
+        timings.append(best)
+        print(f"敏感信息数：{entity_count}，耗时：{best:.4f}秒，耗时比：{best / timings[0]:.2f}，"
+              f"数量比：{entity_count / entity_counts[0]:.2f}")
+    
+    print("=== 基准测试结束 ===")
+
 if __name__ == "__main__":
     # 运行用户交互演示
     user_interaction_demo()
     
     # 可选：运行批量测试
-    # batch_test()
\ No newline at end of file
+    # batch_test()
+    
+    # 可选：运行批量脱敏吞吐量基准
+    # batch_benchmark()
+    
+    # 可选：运行会话存储争用基准
+    # session_store_benchmark()
+    
+    # 可选：运行脱敏替换扩展性基准
+    # replacement_benchmark()
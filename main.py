@@ -70,7 +70,8 @@ class HaSPrivacySystem:
             'entropy_threshold': 1.2,
             'high_entropy_threshold': 3.5,
             'max_token_len': 64,
-            'min_token_len': 2
+            'min_token_len': 2,
+            'session_db_path': None  # 设置为SQLite数据库文件路径（如 'sessions.db'）即可持久化会话，重启后仍可还原
         }
         
         # 应用配置
@@ -125,38 +126,44 @@ class HaSPrivacySystem:
                 self.logger.error(f"输入文件不存在: {input_file}")
                 raise FileNotFoundError(f"输入文件不存在: {input_file}")
             
-            # 读取文件内容
-            self.logger.info(f"开始处理文件: {input_file}")
-            with open(input_file, 'r', encoding='utf-8') as f:
-                text = f.read()
-            
-            # 处理文本
-            result = self.process_text(text, mode='complete')
-            
             # 确定输出文件路径
             if output_file is None:
                 # 默认在输入文件名后添加_processed后缀
                 file_name, file_ext = os.path.splitext(input_file)
                 output_file = f"{file_name}_processed{file_ext}"
             
-            # 写入结果到输出文件
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(f"=== 原始文本 ===\n{result['original_text']}\n\n")
-                f.write(f"=== 脱敏后文本 ===\n{result['desensitized_text']}\n\n")
-                f.write(f"=== 模拟大模型输出 ===\n{result['llm_output']}\n\n")
-                f.write(f"=== 还原后文本 ===\n{result['restored_text']}\n\n")
+            # 流式处理文件：按块读取、逐块写出，内存占用与文件大小无关
+            self.logger.info(f"开始处理文件: {input_file}")
+            start_time = time.time()
+            section_titles = {
+                'original_text': "=== 原始文本 ===",
+                'desensitized_text': "=== 脱敏后文本 ===",
+                'llm_output': "=== 模拟大模型输出 ===",
+                'restored_text': "=== 还原后文本 ==="
+            }
+            with open(input_file, 'r', encoding='utf-8') as src, open(output_file, 'w', encoding='utf-8') as f:
+                result = self.workflow.run_complete_workflow_stream(src)
+                for section, chunks in result['sections']:
+                    f.write(f"{section_titles[section]}\n")
+                    for chunk in chunks:
+                        f.write(chunk)
+                    f.write("\n\n")
+                
+                num_sensitive = len(result['mapping'])
+                processing_time = time.time() - start_time
                 f.write(f"=== 处理统计信息 ===\n")
-                f.write(f"识别到的敏感信息数量: {result['num_sensitive']}\n")
+                f.write(f"识别到的敏感信息数量: {num_sensitive}\n")
                 f.write(f"会话ID: {result['session_id']}\n")
-                f.write(f"处理时间: {result['processing_time']:.4f}秒\n")
+                f.write(f"处理时间: {processing_time:.4f}秒\n")
             
+            self.logger.info(f"处理完成，识别敏感信息: {num_sensitive}个")
             self.logger.info(f"处理结果已保存到: {output_file}")
             
             return {
                 'output_file': output_file,
                 'session_id': result['session_id'],
-                'num_sensitive': result['num_sensitive'],
-                'processing_time': result['processing_time']
+                'num_sensitive': num_sensitive,
+                'processing_time': processing_time
             }
             
         except Exception as e:
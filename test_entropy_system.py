@@ -1,9 +1,34 @@
+import asyncio
+import io
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
 import unittest
+from unittest import mock
 import time
 import re
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from has_entropy_sensitive_retrieval import (
     EntropyEnhancedSensitiveModel,
-    EntropyEnhancedHaSWorkflow
+    BatchEntropy,
+    CascadeStats,
+    CharClassIndex,
+    CompactMapping,
+    EntropyEnhancedHaSWorkflow,
+    IncrementalEntropy,
+    IntervalSet,
+    KeywordAutomaton,
+    MockAsyncLLMClient,
+    RestoreEngine,
+    SessionStore,
+    SQLiteSessionStore
 )
 
 class TestEntropyEnhancedSensitiveModel(unittest.TestCase):
@@ -41,6 +66,38 @@ class TestEntropyEnhancedSensitiveModel(unittest.TestCase):
         # 文本中有3种3-gram: 'abc', 'bca', 'cab'
         self.assertAlmostEqual(trigram_entropy, 1.58496, places=5)  # log2(3) ≈ 1.58496
     
+    def test_incremental_entropy(self):
+        """测试增量熵计算与逐片段重新统计的结果一致"""
+        tokens = ["张三", "的", "账号", "是", "abc123", "，", "abcabc", "aaaa"]
+        engine = IncrementalEntropy()
+        text = ""
+        for token in tokens:
+            engine.push(token)
+            text += token
+            char_entropy, bigram_entropy, trigram_entropy = engine.entropies()
+            self.assertAlmostEqual(char_entropy, self.model._char_entropy(text), places=9)
+            self.assertAlmostEqual(bigram_entropy, self.model._ngram_entropy(text, 2), places=9)
+            self.assertAlmostEqual(trigram_entropy, self.model._ngram_entropy(text, 3), places=9)
+    
+    @unittest.skipIf(numpy is None, "未安装NumPy")
+    def test_batch_entropy(self):
+        """测试NumPy批量熵计算与逐片段统计一致，批量检测结果与纯Python后端完全相同"""
+        text = "张三的账号是abc123，abcabc aaaa。李明：Zx9Kq2LmP0,市场部经理"
+        spans = [(start, end) for start in range(len(text)) for end in range(start + 1, min(len(text), start + 12) + 1)]
+        starts, ends = zip(*spans)
+        entropies = BatchEntropy(text).entropies(starts, ends)
+        for k, (start, end) in enumerate(spans):
+            span = text[start:end]
+            self.assertAlmostEqual(entropies[0, k], self.model._char_entropy(span), places=9)
+            self.assertAlmostEqual(entropies[1, k], self.model._ngram_entropy(span, 2), places=9)
+            self.assertAlmostEqual(entropies[2, k], self.model._ngram_entropy(span, 3), places=9)
+        
+        long_text = text * 20
+        self.model.configure(entropy_backend='python')
+        expected = self.model._entropy_detect_candidates(long_text)
+        self.model.configure(entropy_backend='numpy')
+        self.assertEqual(self.model._entropy_detect_candidates(long_text), expected)
+    
     def test_tokenize_simple(self):
         """测试简单分词功能"""
         text = "腾讯科技(深圳)有限公司成立于1998年11月"
@@ -48,6 +105,97 @@ class TestEntropyEnhancedSensitiveModel(unittest.TestCase):
         expected_tokens = ["腾讯科技", "(", "深圳", ")", "有限公司成立于", "1998", "年", "11", "月"]
         self.assertEqual(tokens, expected_tokens)
     
+    def test_tokenize_with_offsets(self):
+        """测试分词结果携带原文起止位置"""
+        text = "腾讯科技(深圳)有限公司成立于1998年11月"
+        tokens, starts, ends = self.model._tokenize_simple(text, with_offsets=True)
+        self.assertEqual(tokens, self.model._tokenize_simple(text))
+        for token, start, end in zip(tokens, starts, ends):
+            self.assertEqual(text[start:end], token)
+    
+    @unittest.skipIf(numpy is None, "未安装NumPy")
+    def test_vectorized_tokenizer(self):
+        """测试向量化分词与正则分词的切分结果完全一致，自定义分词模式时回退到正则"""
+        text = "张三 abc123\t，。\"x\"（测试）《书》:a,b\\c　龥龦😀é-_\n李四。。"
+        self.assertTrue(self.model.vectorized_tokenizer)
+        vectorized = self.model._tokenize_simple(text, with_offsets=True)
+        self.model.vectorized_tokenizer = False
+        self.assertEqual(vectorized, self.model._tokenize_simple(text, with_offsets=True))
+        
+        self.model.configure(builtin_patterns={**self.model.builtin_patterns, 'tokenizer': r'(\S+)'})
+        self.assertFalse(self.model.vectorized_tokenizer)
+        self.assertEqual(self.model._tokenize_simple("ab cd", with_offsets=True)[0], ['ab', 'cd'])
+    
+    def test_candidate_offsets_with_repeated_text(self):
+        """测试重复出现的片段使用各自的真实位置"""
+        text = "张三。李四。张三。"
+        candidates = self.model._entropy_detect_candidates(text)
+        for candidate in candidates:
+            self.assertEqual(text[candidate['start']:candidate['end']], candidate['text'])
+        
+        # 第二次出现的“张三”应定位到其自身位置，而不是第一次出现的位置
+        name_starts = sorted(c['start'] for c in candidates if c['text'] == '张三')
+        self.assertEqual(name_starts, [0, 6])
+    
+    def test_keyword_automaton(self):
+        """测试关键词自动机的区间查询与逐个子串检查结果一致"""
+        automaton = KeywordAutomaton({
+            'position': ['经理', '总经理', 'CEO'],
+            'department': ['部', '研发部']
+        })
+        text = "研发部总经理李四兼任CEO"
+        index = automaton.index(text)
+        for start in range(len(text) + 1):
+            for end in range(start, len(text) + 1):
+                span = text[start:end]
+                self.assertEqual(index.contains('position', start, end),
+                                 any(k in span for k in ['经理', '总经理', 'CEO']))
+                self.assertEqual(index.contains('department', start, end),
+                                 any(k in span for k in ['部', '研发部']))
+        
+        # 模型的职位/部门判断使用同一个自动机
+        self.assertEqual(self.model._is_position_or_department("技术总监"), 'position')
+        self.assertEqual(self.model._is_position_or_department("市场部"), 'department')
+        self.assertIsNone(self.model._is_position_or_department("张三"))
+    
+    def test_char_class_index(self):
+        """测试字符类别索引：任意区间的判断与逐段正则匹配一致"""
+        text = "账号abc123456，联系：李明。x-y_z １２【测试】AB12cd"
+        index = CharClassIndex(text)
+        for start in range(len(text)):
+            for end in range(start, len(text) + 1):
+                span = text[start:end]
+                for name in ('heuristic.alnum_run', 'heuristic.digits', 'heuristic.latin',
+                             'heuristic.ascii_digits', 'heuristic.word'):
+                    expected = self.model.pattern_registry.search(name, span) is not None
+                    self.assertEqual(index.contains(name, start, end), expected, (name, span))
+                self.assertEqual(index.all_cjk(start, end), all('\u4e00' <= char <= '\u9fff' for char in span))
+                self.assertEqual(index.count('punctuation', start, end),
+                                 sum(1 for char in span if char in '，。！？；：""''（）【】《》'))
+        self.assertTrue(index.after_terminal(text.index('。') + 1))
+        self.assertTrue(index.before_terminal(text.index('。'), len(text)))
+        
+        # 自定义启发式模式时回退到正则匹配
+        self.model.configure(builtin_patterns={**self.model.builtin_patterns, 'heuristic.alnum_run': r'[a-z]{3,}'})
+        self.assertFalse(self.model.char_index_heuristics)
+        self.assertTrue(self.model._heuristic('heuristic.alnum_run', 'abc', CharClassIndex('abc'), 0, 3))
+    
+    def test_interval_set(self):
+        """测试有序区间集合的重叠判断和合并"""
+        spans = IntervalSet()
+        spans.add(10, 20)
+        spans.add(30, 40)
+        self.assertTrue(spans.overlaps(15, 35))
+        self.assertTrue(spans.overlaps(39, 50))
+        self.assertFalse(spans.overlaps(20, 30))
+        self.assertFalse(spans.overlaps(0, 10))
+        self.assertFalse(spans.overlaps(12, 12))
+        
+        # 重叠区间合并后集合仍保持有序且互不相交
+        spans.add(18, 32)
+        self.assertEqual((spans.starts, spans.ends), ([10], [40]))
+        self.assertEqual(len(spans), 1)
+    
     def test_regex_detect_sensitive(self):
         """测试正则表达式检测敏感信息"""
         # 测试手机号检测
@@ -73,6 +221,66 @@ class TestEntropyEnhancedSensitiveModel(unittest.TestCase):
         self.assertEqual(matches[0]['type'], 'email')
         self.assertEqual(matches[1]['type'], 'email')
     
+    def test_pattern_registry(self):
+        """测试正则注册表预编译、按需重新编译和统计计数"""
+        registry = self.model.pattern_registry
+        phone_pattern = registry.compiled('phone')
+        email_pattern = registry.compiled('email')
+        
+        # 修改单个类型的正则，只有该模式被重新编译
+        sensitive_types = dict(self.model.sensitive_types)
+        sensitive_types['email'] = dict(sensitive_types['email'], regex=r'[a-z]+@[a-z]+\.com')
+        sensitive_types['ticket'] = {'enable': True, 'regex': r'TK-\d{6}', 'entropy_based': False}
+        self.model.configure(sensitive_types=sensitive_types)
+        self.assertIs(registry.compiled('phone'), phone_pattern)
+        self.assertIsNot(registry.compiled('email'), email_pattern)
+        self.assertIn('ticket', registry)
+        
+        matches = self.model._regex_detect_sensitive("工单TK-123456，电话13800138000")
+        self.assertIn('ticket', [m['type'] for m in matches])
+        
+        stats = self.model.get_pattern_stats()
+        self.assertEqual(stats['ticket']['hits'], 1)
+        self.assertEqual(stats['phone']['hits'], 1)
+        self.assertGreaterEqual(stats['tokenizer']['time'], 0.0)
+    
+    def test_configure_sensitive_type_names(self):
+        """测试以类型名称列表配置时只启用列出的类型"""
+        self.model.configure(sensitive_types=['phone', 'email'])
+        self.assertIsInstance(self.model.sensitive_types, dict)
+        self.assertTrue(self.model.sensitive_types['phone']['enable'])
+        self.assertFalse(self.model.sensitive_types['id']['enable'])
+        
+        matches = self.model._regex_detect_sensitive("身份证号110101199001011234，电话13800138000")
+        self.assertEqual({m['type'] for m in matches}, {'phone'})
+    
+    def test_combined_regex_scan(self):
+        """测试合并扫描一次返回按位置排序、互不重叠的带类型匹配"""
+        text = "IP: 192.168.1.1，手机13800138000，身份证110101199001011234，增长20%"
+        matches = self.model._regex_detect_sensitive(text)
+        self.assertEqual([m['type'] for m in matches], ['ip', 'phone', 'id', 'performance'])
+        for previous, current in zip(matches, matches[1:]):
+            self.assertLessEqual(previous['end'], current['start'])
+        
+        # 整个检测过程中正则类型和结构化规则各自只扫描一次
+        self.model.detect_sensitive_info(text)
+        stats = self.model.get_pattern_stats()
+        self.assertEqual(stats['combined.regex']['calls'], 2)
+        self.assertEqual(stats['combined.structured']['calls'], 1)
+        self.assertEqual(stats['phone']['calls'], 0)
+        self.assertEqual([m for m in self.model.detect_sensitive_info(text) if m['type'] in ('ip', 'phone', 'id', 'performance')],
+                         matches)
+    
+    def test_structured_rules_do_not_truncate_regex(self):
+        """测试更早开始的结构化规则匹配不会截断正则类型的匹配，电话号码的任何数字都不会留在脱敏结果中"""
+        desensitized_text, mapping, _ = self.model.desensitize("请拨打(010)13800138000联系张经理")
+        self.assertIn('13800138000', mapping.values())
+        self.assertNotRegex(re.sub(r'<\w+?_\d+>', '', desensitized_text), r'\d{4}')
+        
+        desensitized_text, mapping, _ = self.model.desensitize("座机010-13800138000", sensitive_types=['phone', 'email'])
+        self.assertEqual(desensitized_text, "座机010-<phone_1>")
+        self.assertEqual(mapping['<phone_1>'], '13800138000')
+    
     def test_detect_sensitive_info(self):
         """测试综合检测敏感信息"""
         text = "张三（身份证号：110101199001011234）是腾讯科技(深圳)有限公司的CEO，联系电话是13800138000，邮箱是zhangsan@example.com"
@@ -145,6 +353,398 @@ class TestEntropyEnhancedSensitiveModel(unittest.TestCase):
         # 验证还原后的文本与原始文本相同
         self.assertEqual(restored_text, original_text)
     
+    def test_score_candidate(self):
+        """测试候选评分接口返回的结果记录"""
+        text = "联系人张三，账号Zx9Qw8Er7Ty6"
+        score = self.model.score_candidate(text, 3, 5)
+        self.assertEqual(score.text, '张三')
+        self.assertEqual((score.start, score.end), (3, 5))
+        self.assertEqual(score.type, 'name')
+        
+        # 非敏感片段同样返回记录，类型为None
+        score = self.model.score_candidate(text, 5, 6)
+        self.assertIsNone(score.type)
+    
+    def test_restore_engine(self):
+        """测试单次扫描还原及会话上的还原引擎缓存"""
+        mapping = {'<name_1>': '张三', '<name_10>': '李四', '<phone_1>': '13800138000'}
+        text = "<name_10>和<name_1>的电话都是<phone_1>，<name_1>确认过"
+        restored_text = self.model.restore(text, mapping)
+        self.assertEqual(restored_text, "李四和张三的电话都是13800138000，张三确认过")
+        
+        # 同一会话多次还原复用已编译的引擎
+        _, mapping, session_id = self.model.desensitize("联系电话13800138000")
+        first = self.model.restore("回复：<phone_1>", mapping, session_id)
+        engine = self.model.sessions.restore_engine(session_id)
+        second = self.model.restore("再次回复：<phone_1>", mapping, session_id)
+        self.assertEqual(first, "回复：13800138000")
+        self.assertEqual(second, "再次回复：13800138000")
+        self.assertIs(self.model.sessions.restore_engine(session_id), engine)
+    
+    def test_restore_stream(self):
+        """测试流式还原：占位符被切分到多个文本块时结果与整体还原一致"""
+        mapping = {'<name_1>': '张三', '<name_10>': '李四', '[REDACTED_PHONE]': '13800138000'}
+        text = "<name_10>和<name_1>的电话是[REDACTED_PHONE]，<name_1"
+        expected = self.model.restore(text, mapping)
+        for size in (1, 2, 3, 5, 7):
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            self.assertEqual(''.join(self.model.restore_stream(chunks, mapping)), expected)
+        
+        # 不可能是占位符开头的文本立即输出，可能的占位符开头被保留
+        stream = self.model.restore_stream(iter(["你好，", "<name_", "1>。"]), mapping)
+        self.assertEqual(next(stream), "你好，")
+        self.assertEqual(list(stream), ["张三。"])
+        
+        # 工作流按会话流式还原
+        workflow = EntropyEnhancedHaSWorkflow()
+        result = workflow.run_desensitization("联系电话13800138000")
+        chunks = ["回复：", "<pho", "ne_1", ">结束"]
+        restored = ''.join(workflow.restore_stream(result['session_id'], chunks))
+        self.assertEqual(restored, "回复：13800138000结束")
+    
+    def test_desensitize_stream(self):
+        """测试按窗口流式脱敏：跨窗口的实体完整替换，整个文件共用一个会话映射"""
+        line = "用户张三，电话13800138000，邮箱zhangsan@example.com，身份证110101199001011234。\n"
+        text = line * 40
+        self.model.stream_chunk_size = 200
+        self.model.stream_overlap = 80
+        
+        chunks, mapping, session_id = self.model.desensitize_stream(io.StringIO(text))
+        desensitized_chunks = list(chunks)
+        self.assertGreater(len(desensitized_chunks), 1)
+        
+        desensitized_text = ''.join(desensitized_chunks)
+        self.assertNotIn("13800138000", desensitized_text)
+        # 每行：姓名短语、电话、邮箱、身份证各一处；级联检测后“用户张三”不再被跨越电话号码的宽片段压制，由每行3处变为4处
+        self.assertEqual(len(mapping), 160)
+        self.assertIs(self.model.get_session_mapping(session_id), mapping)
+        self.assertEqual(self.model.restore(desensitized_text, mapping, session_id), text)
+    
+    def test_detection_cache(self):
+        """测试检测缓存：重复文本命中，配置变化后失效，按条目数淘汰"""
+        self.assertIsNone(self.model.get_detection_cache_stats())
+        self.model.configure(detection_cache_size=2)
+        text = "张三的联系电话是13800138000，邮箱是zhangsan@example.com"
+        
+        first = self.model.detect_sensitive_info(text)
+        first[0]['type'] = 'modified'
+        second = self.model.detect_sensitive_info(text)
+        self.assertNotEqual(second[0]['type'], 'modified')
+        self.assertEqual(self.model.get_detection_cache_stats()['hits'], 1)
+        self.assertEqual(self.model.get_detection_cache_stats()['misses'], 1)
+        
+        # 配置变化后重新检测
+        self.model.configure(entropy_threshold=2.0)
+        self.model.detect_sensitive_info(text)
+        self.assertEqual(self.model.get_detection_cache_stats()['misses'], 2)
+        
+        for other in ("李四的电话13900139000", "王五的电话13700137000"):
+            self.model.detect_sensitive_info(other)
+        stats = self.model.get_detection_cache_stats()
+        self.assertEqual(stats['entries'], 2)
+        self.assertGreater(stats['bytes'], 0)
+        self.model.detect_sensitive_info(text)
+        self.assertEqual(self.model.get_detection_cache_stats()['misses'], 5)
+        
+        # 正则类型优先级和结构化规则同样影响检测结果
+        fingerprint = self.model.config_fingerprint
+        self.model.configure(regex_type_priority=tuple(reversed(self.model.regex_type_priority)))
+        self.assertNotEqual(self.model.config_fingerprint, fingerprint)
+        fingerprint = self.model.config_fingerprint
+        self.model.configure(entropy_structured_rules=self.model.entropy_structured_rules[:1])
+        self.assertNotEqual(self.model.config_fingerprint, fingerprint)
+        self.model.detect_sensitive_info(text)
+        self.assertEqual(self.model.get_detection_cache_stats()['misses'], 6)
+        
+        # 直接修改 sensitive_types 后不再返回旧的缓存结果
+        self.model.sensitive_types['phone']['enable'] = False
+        self.assertNotIn('phone', [m['type'] for m in self.model.detect_sensitive_info(text)])
+        self.assertEqual(self.model.get_detection_cache_stats()['misses'], 7)
+    
+    def test_detection_cascade(self):
+        """测试级联检测：熵检测不再枚举跨越正则结果的组合，并统计各阶段覆盖的字符数"""
+        text = "用户张三，电话13800138000，身份证110101199001011234。"
+        self.model.configure(enable_detection_cascade=False)
+        full = self.model.detect_sensitive_info(text)
+        self.model.configure(enable_detection_cascade=True)
+        cascaded = self.model.detect_sensitive_info(text)
+        
+        regex_matches = [match for match in full if match['type'] in ('phone', 'id')]
+        self.assertEqual([match for match in cascaded if match['type'] in ('phone', 'id')], regex_matches)
+        for match in cascaded:
+            if match not in regex_matches:
+                self.assertTrue(all(match['end'] <= hit['start'] or match['start'] >= hit['end'] for hit in regex_matches))
+        
+        stats = self.model.get_cascade_stats()
+        self.assertEqual(stats['documents'], 2)
+        self.assertEqual(stats['characters'], len(text) * 2)
+        self.assertEqual(stats['regex_covered'], 29 * 2)
+        self.assertEqual(stats['entropy_scanned'], len(text) + len(text) - 29)
+        self.assertGreater(stats['entropy_covered'], 0)
+        
+        # 熵检测阶段没有运行时不计入扫描的字符数
+        self.model.configure(enable_entropy_detection=False)
+        self.model.detect_sensitive_info("张三电话13800138000")
+        self.model.configure(enable_entropy_detection=True)
+        self.model.detect_sensitive_info("张三电话13800138000", ['phone'])
+        self.assertEqual(self.model.get_cascade_stats()['entropy_scanned'], stats['entropy_scanned'])
+    
+    def test_detection_plan(self):
+        """测试按所需敏感类型规划检测：方案按配置缓存，只运行所需类型的正则，只需正则类型时不运行熵检测枚举"""
+        text = "联系人：张伟，身份证110101200001011234，电话13800138000，邮箱zhangsan@example.com"
+        plan = self.model._detection_plan(['phone', 'email'])
+        self.assertIs(self.model._detection_plan(['email', 'phone']), plan)
+        self.assertFalse(plan.entropy)
+        self.assertEqual([rule[1] for rule in plan.structured_rules], ['email', 'phone', 'phone', 'phone'])
+        self.assertTrue(self.model._detection_plan(['name']).identity)
+        self.assertFalse(self.model._detection_plan(['name']).tail)
+        
+        expected = [match for match in self.model.detect_sensitive_info(text) if match['type'] in ('phone', 'email')]
+        self.assertEqual(self.model.detect_sensitive_info(text, ['phone', 'email']), expected)
+        # 合并扫描只包含所需类型的正则
+        _, labels, separate = self.model._build_combined_pattern('regex', plan)
+        self.assertEqual({label for _, _, label in list(labels.values()) + separate}, {'phone', 'email'})
+        # 只保留结构化候选，不再枚举token组合
+        candidates = self.model._entropy_detect_candidates(text, plan=plan)
+        self.assertTrue(candidates)
+        self.assertTrue(all(candidate['token_start'] == -1 for candidate in candidates))
+        
+        self.assertEqual([match['text'] for match in self.model.detect_sensitive_info(text, ['name'])], ['张伟'])
+        
+        # 配置变化后重新规划
+        self.model.configure(entropy_threshold=self.model.entropy_threshold)
+        self.assertIsNot(self.model._detection_plan(['phone', 'email']), plan)
+    
+    def test_detect_sharded(self):
+        """测试单文档分片并行检测：修正偏移并去除跨边界重复后与整体检测结果一致"""
+        text = "".join(f"员工{i}的联系电话是1380013800{i % 10}，邮箱是user{i}@example.com。\n" for i in range(60))
+        expected = self.model.detect_sensitive_info(text)
+        
+        self.model.configure(shard_workers=2, shard_size=400, shard_overlap=64)
+        self.addCleanup(self.model.shutdown_shard_pool)
+        self.assertGreater(len(self.model._shard_bounds(text)), 2)
+        
+        single_stats = self.model.get_cascade_stats()
+        self.model.cascade_stats = CascadeStats()
+        sharded = self.model.detect_sensitive_info(text)
+        self.assertEqual([(m['start'], m['end'], m['type']) for m in sharded],
+                         [(m['start'], m['end'], m['type']) for m in expected])
+        for match in sharded:
+            self.assertEqual(text[match['start']:match['end']], match['text'])
+        
+        # 各分片的覆盖统计只计入自身负责的区间，在主进程中汇总
+        stats = self.model.get_cascade_stats()
+        self.assertEqual(stats['documents'], 1)
+        self.assertEqual(stats['characters'], len(text))
+        self.assertEqual(stats['regex_covered'], single_stats['regex_covered'])
+        self.assertEqual(stats['entropy_scanned'], len(text) - stats['regex_covered'])
+        
+        # 直接修改的检测属性同样传给工作进程，进程池随之重建
+        pool = self.model.shard_pool
+        self.model.entropy_threshold = 3.0
+        self.model.max_token_len = 8
+        sharded = self.model.detect_sensitive_info(text)
+        self.assertIsNot(self.model.shard_pool, pool)
+        self.model.shard_workers = 0
+        self.assertEqual(sharded, self.model.detect_sensitive_info(text))
+    
+    def test_session_store_threads(self):
+        """测试多线程并发创建会话：会话ID唯一且均可读取，超出容量时淘汰最早的会话"""
+        store = SessionStore(max_sessions=4000, stripes=8)
+        created = [[] for _ in range(8)]
+        
+        def worker(ids):
+            for i in range(500):
+                ids.append(store.create({f'<name_{i}>': '张三'}))
+        
+        threads = [threading.Thread(target=worker, args=(ids,)) for ids in created]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        all_ids = [session_id for ids in created for session_id in ids]
+        self.assertEqual(len(set(all_ids)), 4000)
+        self.assertEqual(len(store), 4000)
+        self.assertTrue(all(session_id in store for session_id in all_ids))
+        
+        store = SessionStore(max_sessions=4, stripes=2)
+        session_ids = [store.create({}) for _ in range(6)]
+        self.assertEqual(len(store), 4)
+        self.assertNotIn(session_ids[0], store)
+        self.assertNotIn(session_ids[1], store)
+        self.assertIn(session_ids[-1], store)
+    
+    def test_session_eviction(self):
+        """测试会话缓存按最近访问淘汰（LRU），并支持过期时间和内存上限"""
+        store = SessionStore(max_sessions=4, stripes=1)
+        session_ids = [store.create({f'<name_{i}>': '张三'}) for i in range(4)]
+        # 访问最早的会话后，它不再是最先被淘汰的
+        self.assertEqual(store.get(session_ids[0]), {'<name_0>': '张三'})
+        store.create({})
+        self.assertIn(session_ids[0], store)
+        self.assertNotIn(session_ids[1], store)
+        self.assertEqual(len(store), 4)
+        
+        # 通过 configure 调整上限后立即生效
+        for i in range(64):
+            self.model._create_session({})
+        self.model.configure(max_sessions=16)
+        self.assertEqual(len(self.model.sessions), 16)
+        
+        # 总上限小于分条数或不是分条数的倍数时同样严格执行；缩减上限时保留最近的会话
+        store = SessionStore(max_sessions=1)
+        session_ids = [store.create({}) for _ in range(20)]
+        self.assertEqual(len(store), 1)
+        self.assertIn(session_ids[-1], store)
+        store = SessionStore(max_sessions=50)
+        session_ids = [store.create({}) for _ in range(200)]
+        self.assertEqual(len(store), 50)
+        store.configure(max_sessions=3)
+        self.assertEqual(len(store), 3)
+        self.assertEqual([session_id in store for session_id in session_ids[-3:]], [True] * 3)
+        
+        # 成员检查是只读的，不会改变淘汰顺序
+        store = SessionStore(max_sessions=2, stripes=1)
+        first, second = store.create({}), store.create({})
+        self.assertIn(first, store)
+        store.create({})
+        self.assertNotIn(first, store)
+        self.assertIn(second, store)
+        
+        # 过期时间
+        store = SessionStore(stripes=1, ttl=0.05)
+        session_id = store.create({'<name_1>': '张三'})
+        self.assertIn(session_id, store)
+        time.sleep(0.06)
+        self.assertNotIn(session_id, store)
+        
+        # 内存上限：按映射大小估算，超出时淘汰最久未访问的会话
+        mapping = {f'<name_{i}>': '张三' * 10 for i in range(20)}
+        store = SessionStore(stripes=1, max_bytes=SessionStore.mapping_size(mapping) * 3)
+        session_ids = [store.create(dict(mapping)) for _ in range(5)]
+        self.assertEqual(len(store), 3)
+        self.assertEqual([session_id in store for session_id in session_ids], [False, False, True, True, True])
+        
+        # 上限和LRU顺序在所有分条之间全局生效，不会拆分成各分条独立的上限
+        store = SessionStore(max_bytes=SessionStore.mapping_size(mapping) * 3)
+        session_ids = [store.create(dict(mapping)) for _ in range(3)]
+        self.assertEqual([session_id in store for session_id in session_ids], [True] * 3)
+        store.get(session_ids[0])
+        session_ids.append(store.create(dict(mapping)))
+        self.assertEqual([session_id in store for session_id in session_ids], [True, False, True, True])
+        store = SessionStore(max_sessions=4, stripes=16)
+        session_ids = [store.create({}) for _ in range(4)]
+        store.get(session_ids[0])
+        session_ids.append(store.create({}))
+        self.assertEqual([session_id in store for session_id in session_ids], [True, False, True, True, True])
+        self.assertIsNone(store.get(session_ids[1]))
+        self.assertEqual(sum(len(stripe.mappings) for stripe in store.stripes), 4)
+    
+    def test_sqlite_session_store(self):
+        """测试SQLite会话存储：模型重建后仍可按会话ID还原，流式脱敏的映射同步保存"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'sessions.db')
+        
+        self.model.configure(session_db_path=path)
+        self.addCleanup(self.model.set_session_store, SessionStore())
+        self.assertIsInstance(self.model.sessions, SQLiteSessionStore)
+        desensitized_text, mapping, session_id = self.model.desensitize(
+            "张三的联系电话是13800138000", strategy='pseudonymization')
+        chunks, _, stream_session_id = self.model.desensitize_stream(io.StringIO("邮箱是zhangsan@example.com\n"))
+        stream_text = ''.join(chunks)
+        self.model.sessions.flush()
+        
+        # 模拟进程重启：新的模型实例从同一数据库读取会话
+        restarted = EntropyEnhancedSensitiveModel()
+        restarted.configure(session_db_path=path)
+        self.addCleanup(restarted.set_session_store, SessionStore())
+        self.assertEqual(restarted.get_session_mapping(session_id), mapping)
+        restored = restarted.restore(desensitized_text, restarted.get_session_mapping(session_id), session_id)
+        self.assertEqual(restored, "张三的联系电话是13800138000")
+        stream_mapping = restarted.get_session_mapping(stream_session_id)
+        self.assertEqual(restarted.restore(stream_text, stream_mapping, stream_session_id), "邮箱是zhangsan@example.com\n")
+        
+        # 容量限制在批量写入时执行
+        store = SQLiteSessionStore(os.path.join(directory.name, 'limited.db'), max_sessions=3, batch_size=2)
+        self.addCleanup(store.close)
+        session_ids = [store.create({f'<name_{i}>': '张三'}) for i in range(6)]
+        self.assertEqual(len(store), 3)
+        self.assertEqual([session_id in store for session_id in session_ids], [False] * 3 + [True] * 3)
+        
+        # 成员检查是只读的，不会改变淘汰顺序
+        store = SQLiteSessionStore(os.path.join(directory.name, 'readonly.db'), max_sessions=2)
+        self.addCleanup(store.close)
+        first, second = store.create({}), store.create({})
+        store.flush()
+        self.assertIn(first, store)
+        store.create({})
+        store.flush()
+        self.assertNotIn(first, store)
+        self.assertIn(second, store)
+        
+        # 更新会话后不再使用按旧内容编译的还原引擎
+        self.assertEqual(store.restore_engine(second).restore("<phone_1>"), "<phone_1>")
+        store.update(second, {'<phone_1>': '13900139000'})
+        self.assertEqual(store.restore_engine(second).restore("<phone_1>"), "13900139000")
+        store.update(second, {'<phone_1>': '13700137000'})
+        store.flush()
+        self.assertEqual(store.restore_engine(second).restore("<phone_1>"), "13700137000")
+    
+    def test_sqlite_session_visibility(self):
+        """测试SQLite会话存储：写入方空闲时缓存的会话也会在刷新间隔后对其他存储实例可见，关闭时关闭所有线程的连接"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'sessions.db')
+        
+        writer = SQLiteSessionStore(path, flush_interval=0.05)
+        self.addCleanup(writer.close)
+        session_id = writer.create({'<phone_1>': '13800138000'})
+        time.sleep(0.5)
+        reader = SQLiteSessionStore(path)
+        self.addCleanup(reader.close)
+        self.assertEqual(dict(reader.get(session_id).items()), {'<phone_1>': '13800138000'})
+        
+        # 其他线程打开的连接同样在关闭时关闭
+        thread = threading.Thread(target=reader.get, args=(session_id,))
+        thread.start()
+        thread.join()
+        connections = list(reader.connections)
+        self.assertGreater(len(connections), 1)
+        reader.close()
+        for connection in connections:
+            with self.assertRaises(sqlite3.ProgrammingError):
+                connection.execute('SELECT 1')
+    
+    def test_compact_mapping(self):
+        """测试紧凑映射：与字典等价、可直接还原，二进制序列化往返不变"""
+        mapping = {f'<name_{i}>': f'张{i}' for i in range(1, 50)}
+        mapping.update({
+            '<PSEUDO_phone_1>': ('13912345678', '13800138000'),
+            '[REDACTED_EMAIL]': 'zhangsan@example.com',
+            '<id_007>': '110101199001011234'
+        })
+        compact = CompactMapping(mapping)
+        self.assertEqual(compact, mapping)
+        self.assertEqual(list(compact), list(mapping))
+        self.assertEqual(compact['<PSEUDO_phone_1>'], ('13912345678', '13800138000'))
+        self.assertEqual(compact['<id_007>'], '110101199001011234')
+        self.assertNotIn('<name_0>', compact)
+        self.assertLess(SessionStore.mapping_size(compact), SessionStore.mapping_size(mapping))
+        
+        self.assertEqual(CompactMapping.from_bytes(compact.to_bytes()), mapping)
+        self.assertEqual(pickle.loads(pickle.dumps(compact)), mapping)
+        
+        text = "<name_12>的电话13912345678，邮箱[REDACTED_EMAIL]"
+        self.assertEqual(self.model.restore(text, compact), self.model.restore(text, mapping))
+        
+        # 会话中以紧凑格式保存时仍可按会话还原
+        self.model.configure(compact_session_mappings=True)
+        desensitized_text, mapping, session_id = self.model.desensitize("张三的联系电话是13800138000")
+        self.assertIsInstance(self.model.get_session_mapping(session_id), CompactMapping)
+        self.assertEqual(self.model.restore(desensitized_text, mapping, session_id), "张三的联系电话是13800138000")
+    
     def test_session_management(self):
         """测试会话管理功能"""
         # 创建多个会话
@@ -236,6 +836,23 @@ class TestEntropyEnhancedHaSWorkflow(unittest.TestCase):
         self.assertIn('13800138000', restore_result['restored_text'])
         self.assertIn('zhangsan@example.com', restore_result['restored_text'])
     
+    def test_run_restore_sqlite_engine_cache(self):
+        """测试按会话ID还原时复用持久化会话存储上缓存的还原引擎，多次还原只编译一次"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.workflow.configure(session_db_path=os.path.join(directory.name, 'sessions.db'))
+        self.addCleanup(self.workflow.endside_model.set_session_store, SessionStore())
+        result = self.workflow.run_desensitization("张三的联系电话是13800138000")
+        store = self.workflow.endside_model.sessions
+        store.flush()
+        
+        with mock.patch('has_entropy_sensitive_retrieval.RestoreEngine', wraps=RestoreEngine) as compiled:
+            for _ in range(5):
+                restored = self.workflow.run_restore("回复：<phone_1>", result['session_id'])['restored_text']
+                self.assertEqual(restored, "回复：13800138000")
+        self.assertEqual(compiled.call_count, 1)
+        self.assertIn(result['session_id'], store.engines)
+    
     def test_run_complete_workflow(self):
         """测试运行完整的工作流"""
         original_text = "张三的联系电话是13800138000，邮箱是zhangsan@example.com"
@@ -259,6 +876,90 @@ class TestEntropyEnhancedHaSWorkflow(unittest.TestCase):
         
         # 验证处理时间是有效的
         self.assertGreater(result['processing_time'], 0)
+    
+    def test_request_context_per_thread(self):
+        """测试多线程共用工作流时，各线程的当前会话互不干扰"""
+        results = {}
+        barrier = threading.Barrier(4)
+        
+        def handle(i):
+            text = f"员工{i}的联系电话是1380013800{i}"
+            self.workflow.run_desensitization(text)
+            barrier.wait()
+            # 不传会话ID时使用本线程的当前会话
+            results[i] = self.workflow.run_restore("电话：<phone_1>")['restored_text']
+        
+        threads = [threading.Thread(target=handle, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(results, {i: f"电话：1380013800{i}" for i in range(4)})
+        self.assertIsNone(self.workflow.current_session_id)
+    
+    def test_arun_complete_workflow(self):
+        """测试异步工作流：并发请求互不影响，并发上限和阶段超时生效"""
+        class SlowEchoClient:
+            def __init__(self):
+                self.in_flight = 0
+                self.max_in_flight = 0
+            
+            async def complete(self, prompt):
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                await asyncio.sleep(0.01)
+                self.in_flight -= 1
+                return f"回答：{prompt}"
+        
+        client = SlowEchoClient()
+        self.workflow.configure(max_concurrency=3)
+        texts = [f"员工{i}的联系电话是1380013800{i}" for i in range(8)]
+        
+        async def run_all():
+            return await asyncio.gather(*[self.workflow.arun_complete_workflow(text, client) for text in texts])
+        
+        results = asyncio.run(run_all())
+        self.assertEqual([r['restored_text'] for r in results], [f"回答：{text}" for text in texts])
+        self.assertEqual(client.max_in_flight, 3)
+        
+        # 大模型阶段超时
+        self.workflow.configure(stage_timeouts={'llm': 0.001})
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(self.workflow.arun_complete_workflow(texts[0], MockAsyncLLMClient(str, latency=1)))
+        
+        # 空输入直接返回空结果，不调用大模型
+        result = asyncio.run(self.workflow.arun_complete_workflow("", client))
+        self.assertEqual(result['restored_text'], "")
+        self.assertIsNone(result['session_id'])
+        self.assertEqual(result['num_sensitive'], 0)
+        self.assertEqual(client.max_in_flight, 3)
+    
+    def test_run_desensitization_batch(self):
+        """测试进程池批量脱敏：结果按输入顺序返回，且与顺序处理一致"""
+        texts = [f"员工{i}的联系电话是1380013800{i}，邮箱是user{i}@example.com" for i in range(6)]
+        self.workflow.configure(desensitization_strategy='anonymization')
+        self.addCleanup(self.workflow.shutdown_batch_pool)
+        
+        parallel = self.workflow.run_desensitization_batch(texts, workers=2, chunksize=2)
+        sequential = self.workflow.run_desensitization_batch(texts, workers=1)
+        
+        self.assertEqual([r['desensitized_text'] for r in parallel], [r['desensitized_text'] for r in sequential])
+        self.assertEqual([r['mapping'] for r in parallel], [r['mapping'] for r in sequential])
+        for text, result in zip(texts, parallel):
+            self.assertIn('[REDACTED_PHONE]', result['desensitized_text'])
+            restored = self.workflow.run_restore(result['desensitized_text'], result['session_id'])
+            self.assertEqual(restored['restored_text'], text)
+        
+        # 工作进程使用端侧模型当前的检测配置，包括直接修改的属性
+        pool = self.workflow.batch_pool
+        self.workflow.endside_model.enable_entropy_detection = False
+        self.workflow.endside_model.sensitive_types['email']['enable'] = False
+        parallel = self.workflow.run_desensitization_batch(texts, workers=2, chunksize=2)
+        self.assertIsNot(self.workflow.batch_pool, pool)
+        sequential = self.workflow.run_desensitization_batch(texts, workers=1)
+        self.assertEqual([r['mapping'] for r in parallel], [r['mapping'] for r in sequential])
+        self.assertNotIn('[REDACTED_EMAIL]', parallel[0]['mapping'])
 
 class TestPerformance(unittest.TestCase):
     """性能测试"""
@@ -341,6 +1042,51 @@ class TestPerformance(unittest.TestCase):
         # 验证识别到的敏感信息数量
         self.assertGreaterEqual(result['num_sensitive'], 10)  # 应该至少识别到10个敏感信息
 
+    def test_candidate_scoring_consistency(self):
+        """测试单遍候选评分与逐片段重新统计熵值的评分结果一致（耗时对比见 candidate_scoring_benchmark）"""
+        with open('test_long_text.txt', 'r', encoding='utf-8') as f:
+            test_text = f.read()
+        
+        candidates = [candidate for candidate in self.model._entropy_detect_candidates(test_text)
+                      if candidate['token_start'] >= 0]
+        self.assertGreater(len(candidates), 0)
+        for candidate in candidates:
+            score = self.model.score_candidate(test_text, candidate['start'], candidate['end'])
+            self.assertEqual(score.text, candidate['text'])
+            self.assertAlmostEqual(score.entropy, candidate['entropy'], places=9)
+            self.assertEqual(score.type, candidate['type'])
+
+    def test_replacement_scaling(self):
+        """测试脱敏替换与逐个切片替换的结果一致，且原文只被切片复制一遍（耗时对比见 replacement_benchmark）"""
+        segment = "客户电话13800138000，"
+        
+        class CountingStr(str):
+            """记录切片次数和切片复制的字符总数"""
+            def __getitem__(self, key):
+                piece = str.__getitem__(self, key)
+                self.slices += 1
+                self.copied += len(piece)
+                return piece
+        
+        for entity_count in (40, 4000):
+            text = CountingStr(segment * entity_count)
+            text.slices = text.copied = 0
+            detected = [{'text': '13800138000', 'start': i * len(segment) + 4,
+                         'end': i * len(segment) + 15, 'type': 'phone'} for i in range(entity_count)]
+            
+            # 参照实现：按结束位置倒序逐个切片拼接
+            expected = str(text)
+            for number, info in enumerate(sorted(detected, key=lambda x: x['end'], reverse=True), 1):
+                expected = expected[:info['start']] + f'<phone_{number}>' + expected[info['end']:]
+            text.slices = text.copied = 0
+            
+            result_text, mapping = self.model._apply_replacements(text, detected, 'placeholder')
+            self.assertEqual(result_text, expected)
+            self.assertEqual(len(mapping), entity_count)
+            # 每个未替换的原文片段只切片一次，复制的字符总数不超过原文长度
+            self.assertEqual(text.slices, entity_count + 1)
+            self.assertEqual(text.copied, len(text) - len('13800138000') * entity_count)
+
 # 批量测试函数
 def batch_test():
     """批量测试函数，用于验证系统在多种场景下的性能和准确性"""